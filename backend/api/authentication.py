@@ -0,0 +1,113 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import cache_is_shared
+
+VERSION_CACHE_PREFIX = 'auth_version:'
+
+
+class TokenCache:
+    '''Кэш токен -> (пользователь, токен) в памяти процесса.
+
+    Размер ограничен TOKEN_CACHE_SIZE (вытесняются давно не
+    использованные записи), время жизни записи — TOKEN_CACHE_TIMEOUT.
+    Запись сверяется с версией пользователя в кэше Django, поэтому
+    invalidate_user() действует на все процессы, только если этот кэш
+    общий (CACHE_BACKEND). С кэшем в памяти процесса удаление токена
+    или деактивация пользователя в другом воркере, админке или команде
+    manage.py остались бы незамеченными, поэтому кэш токенов отключен.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def enabled(self):
+        return cache_is_shared()
+
+    def _version(self, user_id):
+        return cache.get(f'{VERSION_CACHE_PREFIX}{user_id}')
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            user, token, version, expires = entry
+            if (
+                expires > time.monotonic()
+                and version == self._version(user.pk)
+            ):
+                with self._lock:
+                    self.hits += 1
+                return copy.copy(user), token
+            self.delete(key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, user, token):
+        entry = (
+            copy.copy(user),
+            token,
+            self._version(user.pk),
+            time.monotonic() + settings.TOKEN_CACHE_TIMEOUT,
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        cache.set(f'{VERSION_CACHE_PREFIX}{user_id}', uuid4().hex, None)
+        with self._lock:
+            for key in [
+                key for key, (user, *_) in self._entries.items()
+                if user.pk == user_id
+            ]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_size': settings.TOKEN_CACHE_SIZE,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / requests if requests else None,
+            }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''TokenAuthentication без запроса к БД для недавно виденных токенов.'''
+
+    def authenticate_credentials(self, key):
+        if not token_cache.enabled:
+            return super().authenticate_credentials(key)
+        credentials = token_cache.get(key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            token_cache.set(key, *credentials)
+        return credentials
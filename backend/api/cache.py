@@ -0,0 +1,180 @@
+import pickle
+import threading
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+from foodgram_backend.cache_backends import is_shared
+
+GENERATION_KEY = 'generation'
+INDEX_PREFIX = 'index:'
+
+
+def cache_is_shared(alias='default'):
+    '''Видят ли записи кэша Django все процессы сервера.'''
+    return is_shared(settings.CACHES[alias]['BACKEND'])
+
+
+class LocalResponseCacheBackend:
+    '''Хранилище кэша ответов поверх django.core.cache.
+
+    Индексы инвалидации хранятся как множества ключей. Для LocMemCache
+    изменения индексов защищены блокировкой процесса.
+    '''
+
+    def __init__(self, location='default', prefix='response_cache:'):
+        self.cache = caches[location]
+        self.prefix = prefix
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(self.prefix + key, value, timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.prefix + key for key in keys])
+
+    def add_to_index(self, index, key, timeout):
+        with self.lock:
+            members = self.cache.get(self.prefix + index) or set()
+            members.add(key)
+            self.cache.set(self.prefix + index, members, timeout)
+
+    def pop_index(self, index):
+        with self.lock:
+            members = self.cache.get(self.prefix + index) or set()
+            self.cache.delete(self.prefix + index)
+        return members
+
+
+class RedisResponseCacheBackend:
+    '''Хранилище кэша ответов в Redis.
+
+    Индексы инвалидации — множества Redis (SADD / SMEMBERS). Вместо
+    redis.Redis можно передать любой клиент с тем же интерфейсом.
+    '''
+
+    def __init__(self, location='', prefix='response_cache:', client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImproperlyConfigured(
+                    'Для RedisResponseCacheBackend нужен пакет redis'
+                )
+            client = redis.Redis.from_url(location)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=timeout)
+
+    def delete_many(self, keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def add_to_index(self, index, key, timeout):
+        pipeline = self.client.pipeline()
+        pipeline.sadd(self.prefix + index, key)
+        pipeline.expire(self.prefix + index, timeout)
+        pipeline.execute()
+
+    def pop_index(self, index):
+        pipeline = self.client.pipeline()
+        pipeline.smembers(self.prefix + index)
+        pipeline.delete(self.prefix + index)
+        members, _ = pipeline.execute()
+        return {
+            member.decode() if isinstance(member, bytes) else member
+            for member in members
+        }
+
+
+class ResponseCache:
+    '''Кэш данных ответов с инвалидацией по зависимостям.
+
+    Каждый сохраненный ответ регистрируется в индексах своих
+    зависимостей (например, 'tag:breakfast' или 'recipe:5'),
+    invalidate() удаляет только ответы из указанных индексов,
+    clear() сбрасывает весь кэш сменой поколения ключей.
+    '''
+
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+
+    def make_key(self, *parts):
+        generation = self.backend.get(GENERATION_KEY) or 0
+        digest = md5(repr(parts).encode()).hexdigest()
+        return f'{generation}:{digest}'
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, dependencies):
+        self.backend.set(key, value, self.timeout)
+        for dependency in dependencies:
+            self.backend.add_to_index(
+                INDEX_PREFIX + dependency, key, self.timeout
+            )
+
+    def invalidate(self, *dependencies):
+        keys = set()
+        for dependency in dependencies:
+            keys |= self.backend.pop_index(INDEX_PREFIX + dependency)
+        self.backend.delete_many(list(keys))
+
+    def clear(self):
+        generation = self.backend.get(GENERATION_KEY) or 0
+        self.backend.set(GENERATION_KEY, generation + 1, None)
+
+
+def get_response_cache():
+    config = settings.RECIPES_RESPONSE_CACHE
+    backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return ResponseCache(backend, config['TIMEOUT'])
+
+
+response_cache = SimpleLazyObject(get_response_cache)
+
+
+def invalidate_on_commit(*dependencies):
+    '''Удаляет ответы из кэша после фиксации текущей транзакции.
+
+    Если удалить их сразу, параллельный анонимный запрос до фиксации
+    прочитал бы старые данные и снова положил их в кэш.
+    '''
+    transaction.on_commit(lambda: response_cache.invalidate(*dependencies))
+
+
+def clear_on_commit():
+    '''Сбрасывает весь кэш ответов после фиксации текущей транзакции.'''
+    transaction.on_commit(lambda: response_cache.clear())
+
+
+def invalidate_recipe(recipe):
+    '''Удаляет из кэша ответы, в которых может встретиться рецепт.
+
+    Зависимости вычисляются сразу (при удалении теги рецепта доступны
+    только до него), ответы удаляются после фиксации транзакции.
+    '''
+    invalidate_on_commit(
+        'all',
+        f'recipe:{recipe.pk}',
+        f'author:{recipe.author_id}',
+        *(
+            f'tag:{slug}'
+            for slug in recipe.tags.values_list('slug', flat=True)
+        )
+    )
@@ -1,15 +1,103 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image
 from rest_framework import serializers
 
+from recipes.images import FORMAT_EXTENSIONS
+
+# Кратно 4, чтобы каждый кусок base64 декодировался отдельно.
+DECODE_CHUNK_SIZE = 64 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'invalid_base64': 'Некорректная строка base64.',
+        'too_large': 'Размер картинки превышает {max_size} байт.',
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей.',
+    }
+
+    def decode(self, data):
+        '''Декодирует base64 по частям во временный файл.
+
+        Размер проверяется до декодирования, поэтому слишком большие
+        картинки отклоняются сразу.
+        '''
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if len(data) // 4 * 3 > max_size:
+            self.fail('too_large', max_size=max_size)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            for start in range(0, len(data), DECODE_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    data[start:start + DECODE_CHUNK_SIZE], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return file
+
+    def check_pixels(self, file):
+        # Pillow читает только заголовок, сами пиксели не декодируются.
+        try:
+            width, height = Image.open(file).size
+        except Exception:
+            self.fail('invalid_image')
+        file.seek(0)
+        max_pixels = settings.IMAGE_MAX_PIXELS
+        if width * height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, _, imgstr = data.partition(';base64,')
             ext = format.split('/')[-1]
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            file = self.decode(imgstr)
+            self.check_pixels(file)
+            data = File(file, name='temp.' + ext)
 
         return super().to_internal_value(data)
+
+
+class ImageRenditionField(serializers.Field):
+    '''Ссылки на уменьшенную копию картинки рецепта в разных форматах.
+
+    Пока копии не готовы, для всех форматов отдается исходная картинка.
+    '''
+
+    def __init__(self, rendition, **kwargs):
+        self.rendition = rendition
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def build_url(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        renditions = recipe.image_renditions
+        names = (
+            renditions.get(self.rendition)
+            if renditions.get('source') == recipe.image.name else None
+        )
+        if not names:
+            url = self.build_url(recipe.image.url)
+            return {
+                FORMAT_EXTENSIONS[image_format]: url
+                for image_format in settings.IMAGE_RENDITION_FORMATS
+            }
+        return {
+            extension: self.build_url(default_storage.url(name))
+            for extension, name in names.items()
+        }
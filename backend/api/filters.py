@@ -1,8 +1,8 @@
-from django.db.models import Q
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as django_filters
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart, Tag
 
 
 class IngredientFilter(SearchFilter):
@@ -19,6 +19,10 @@ class RecipeFilter(django_filters.FilterSet):
     is_favorited = django_filters.BooleanFilter(
         field_name='is_favorited', method='filter_is_favorited'
     )
+    search = django_filters.CharFilter(method='filter_search')
+    ordering = django_filters.ChoiceFilter(
+        choices=(('popular', 'Популярные'),), method='filter_ordering'
+    )
 
     def filter_tags(self, queryset, name, value):
         values = self.request.GET.getlist(key='tags', default=[])
@@ -26,26 +30,31 @@ class RecipeFilter(django_filters.FilterSet):
         if not value:
             return queryset
 
-        queries = [Q(tags__slug=value) for value in values]
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=Tag.objects.filter(slug__in=values).values('id')
+        )))
 
-        query = queries.pop()
-        for item in queries:
-            query |= item
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
 
-        return queryset.filter(query).distinct()
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by('-favorites_count', '-pub_date', '-id')
 
-    def __is_something(self, queryset, name, value, related_field):
+    def __is_something(self, queryset, name, value, model):
         if self.request.user.is_anonymous:
-            return Recipe.objects.none() if value else queryset
+            return queryset.none() if value else queryset
 
-        objects = getattr(self.request.user, related_field).all()
-        return queryset.filter(pk__in=[item.recipe.pk for item in objects])
+        exists = Exists(model.objects.filter(
+            user=self.request.user, recipe=OuterRef('pk')
+        ))
+        return queryset.filter(exists if value else ~exists)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        return self.__is_something(queryset, name, value, 'shoppingcart')
+        return self.__is_something(queryset, name, value, ShoppingCart)
 
     def filter_is_favorited(self, queryset, name, value):
-        return self.__is_something(queryset, name, value, 'favoriterecipe')
+        return self.__is_something(queryset, name, value, FavoriteRecipe)
 
     class Meta:
         model = Recipe
@@ -0,0 +1,325 @@
+import fcntl
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+HELP = {
+    'http_request_duration_seconds': (
+        'histogram', 'Время ответа по маршрутам DRF'
+    ),
+    'http_request_db_queries': (
+        'histogram', 'Число SQL-запросов на HTTP-запрос'
+    ),
+    'http_request_db_duration_seconds': (
+        'histogram', 'Время SQL-запросов на HTTP-запрос'
+    ),
+    'response_cache_requests_total': (
+        'counter', 'Обращения к кэшу ответов для анонимных пользователей'
+    ),
+    'conditional_requests_total': (
+        'counter', 'Условные запросы: 304 или полный ответ'
+    ),
+    'db_connections_total': (
+        'counter', 'Открыто подключений к БД'
+    ),
+    'token_cache_requests_total': (
+        'counter', 'Обращения к кэшу токенов'
+    ),
+    'worker_requests': (
+        'gauge', 'Обработано запросов рабочим процессом'
+    ),
+    'worker_uptime_seconds': (
+        'gauge', 'Время работы рабочего процесса'
+    ),
+    'worker_cpu_seconds': (
+        'gauge', 'Процессорное время рабочего процесса'
+    ),
+    'worker_max_rss_bytes': (
+        'gauge', 'Максимальный объем памяти рабочего процесса'
+    ),
+    'workers': (
+        'gauge', 'Число живых рабочих процессов'
+    ),
+}
+
+
+def labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    '''Счетчики и гистограммы процесса без блокировок на запись.
+
+    Каждый поток пишет в свой набор словарей, поэтому инкременты
+    не требуют блокировки и не теряются при gthread-воркерах.
+    Наборы суммируются только при снимке snapshot().
+    '''
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = (defaultdict(float), {})
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def inc(self, name, labels=None, value=1):
+        self._shard()[0][(name, labels_key(labels or {}))] += value
+
+    def observe(self, name, labels, value):
+        buckets = settings.METRICS['BUCKETS'][name]
+        key = (name, labels_key(labels))
+        histograms = self._shard()[1]
+        histogram = histograms.get(key)
+        if histogram is None:
+            # Счетчики корзин, затем +Inf и сумма значений.
+            histogram = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(buckets)
+        histogram[index] += 1
+        histogram[-1] += value
+
+    def snapshot(self):
+        counters = defaultdict(float)
+        histograms = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard_counters, shard_histograms in shards:
+            # list() копирует словарь под GIL, не мешая записи.
+            for key, value in list(shard_counters.items()):
+                counters[key] += value
+            for key, values in list(shard_histograms.items()):
+                total = histograms.setdefault(key, [0] * len(values))
+                for index, value in enumerate(list(values)):
+                    total[index] += value
+        for name, labels, value in collect_caches():
+            counters[(name, labels_key(labels))] += value
+        return serialize(
+            os.getpid(), counters, histograms,
+            worker_gauges(self.started, histograms)
+        )
+
+
+def serialize(pid, counters, histograms, gauges):
+    return {
+        'pid': pid,
+        'counters': [[*key, value] for key, value in counters.items()],
+        'histograms': [[*key, values] for key, values in histograms.items()],
+        'gauges': gauges,
+    }
+
+
+def collect_caches():
+    from api.authentication import token_cache
+
+    stats = token_cache.stats()
+    yield 'token_cache_requests_total', {'result': 'hit'}, stats['hits']
+    yield 'token_cache_requests_total', {'result': 'miss'}, stats['misses']
+
+
+def worker_gauges(started, histograms):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    requests = sum(
+        sum(values[:-1]) for (name, _), values in histograms.items()
+        if name == 'http_request_duration_seconds'
+    )
+    return {
+        'worker_requests': requests,
+        'worker_uptime_seconds': time.time() - started,
+        'worker_cpu_seconds': usage.ru_utime + usage.ru_stime,
+        # ru_maxrss в Linux измеряется в килобайтах.
+        'worker_max_rss_bytes': usage.ru_maxrss * 1024,
+    }
+
+
+class FileStore:
+    '''Снимки метрик рабочих процессов в общем каталоге.
+
+    Каждый процесс раз в FLUSH_INTERVAL перезаписывает свой файл
+    <pid>.json, /metrics суммирует файлы всех процессов. Снимки
+    завершившихся процессов сводятся в один файл, чтобы счетчики
+    не уменьшались после перезапуска воркеров; каталог очищается
+    при запуске сервера.
+    '''
+
+    archive_name = 'exited.json'
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.pid = None
+
+    @property
+    def path(self):
+        return self.directory / f'{os.getpid()}.json'
+
+    def write(self, path, snapshot):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(temporary, path)
+
+    def flush(self, registry):
+        self.write(self.path, registry.snapshot())
+
+    def start(self, registry):
+        '''Запускает в процессе поток, сохраняющий снимки.
+
+        Поток нужен и простаивающему воркеру: иначе последние запросы
+        перед паузой не попали бы в /metrics.
+        '''
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        threading.Thread(
+            target=self.run, args=(registry,), daemon=True
+        ).start()
+
+    def run(self, registry):
+        while True:
+            time.sleep(settings.METRICS['FLUSH_INTERVAL'])
+            try:
+                self.flush(registry)
+            except OSError:
+                # Каталог могли удалить, следующая попытка его создаст.
+                continue
+
+    def read(self):
+        for path in self.directory.glob('*.json'):
+            try:
+                yield path, json.loads(path.read_text())
+            except (OSError, ValueError):
+                # Файл мог быть удален или перезаписан во время чтения.
+                continue
+
+    def compact(self):
+        '''Сводит снимки завершившихся процессов в один файл.'''
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = [
+                (path, snapshot) for path, snapshot in self.read()
+                if snapshot['pid'] and not is_alive(snapshot['pid'])
+            ]
+            if not exited:
+                return
+            archive = self.directory / self.archive_name
+            snapshots = [snapshot for _, snapshot in exited]
+            if archive.exists():
+                snapshots.append(json.loads(archive.read_text()))
+            counters, histograms, _ = aggregate(snapshots)
+            self.write(archive, serialize(None, counters, histograms, {}))
+            for path, _ in exited:
+                path.unlink(missing_ok=True)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def aggregate(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    gauges = []
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[(name, labels_key(dict(labels)))] += value
+        for name, labels, values in snapshot['histograms']:
+            total = histograms.setdefault(
+                (name, labels_key(dict(labels))), [0] * len(values)
+            )
+            for index, value in enumerate(values):
+                total[index] += value
+        if snapshot['pid'] and is_alive(snapshot['pid']):
+            gauges.append((snapshot['pid'], snapshot['gauges']))
+    return counters, histograms, gauges
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n')
+        )
+        for name, value in labels
+    ) + '}'
+
+
+def format_number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(counters, histograms, gauges):
+    '''Текстовый формат экспозиции Prometheus 0.0.4.'''
+    samples = defaultdict(list)
+    for (name, labels), value in sorted(counters.items()):
+        samples[name].append((name, labels, value))
+    for (name, labels), values in sorted(histograms.items()):
+        cumulative = 0
+        buckets = settings.METRICS['BUCKETS'][name]
+        for bound, count in zip([*buckets, '+Inf'], values[:-1]):
+            cumulative += count
+            samples[name].append((
+                f'{name}_bucket', (*labels, ('le', str(bound))), cumulative
+            ))
+        samples[name].append((f'{name}_sum', labels, values[-1]))
+        samples[name].append((f'{name}_count', labels, cumulative))
+    for pid, values in gauges:
+        for name, value in values.items():
+            samples[name].append((name, (('pid', pid),), value))
+    samples['workers'].append(('workers', (), len(gauges)))
+
+    lines = []
+    for name in sorted(samples):
+        kind, description = HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for sample, labels, value in samples[name]:
+            lines.append(
+                f'{sample}{format_labels(labels)} {format_number(value)}'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+store = FileStore(settings.METRICS['DIRECTORY'])
+
+
+def inc(name, labels=None, value=1):
+    if settings.METRICS['ENABLED']:
+        registry.inc(name, labels, value)
+
+
+def export():
+    '''Метрики всех рабочих процессов в текстовом формате.'''
+    store.flush(registry)
+    store.compact()
+    return render(*aggregate(snapshot for _, snapshot in store.read()))
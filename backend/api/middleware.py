@@ -0,0 +1,196 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from api import metrics
+
+logger = logging.getLogger('api.instrumentation')
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    '''SQL без учета длины списков IN (...) для поиска повторов.'''
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    '''Обработчик execute_wrapper: число, время и отпечатки запросов.
+
+    Сохраняется текст SQL с плейсхолдерами, без параметров, поэтому
+    в журнал не попадают пользовательские данные.
+    '''
+
+    def __init__(self, capture_limit):
+        self.capture_limit = capture_limit
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.fingerprints[fingerprint(sql)] += 1
+            if len(self.captured) < self.capture_limit:
+                self.captured.append((sql, round(duration * 1000, 3)))
+
+    def duplicates(self, threshold):
+        return [
+            {'sql': sql, 'count': count}
+            for sql, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+
+class QueryCounter:
+    '''Обработчик execute_wrapper: только число и время запросов.'''
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    '''Гистограммы времени ответа и SQL-запросов по маршрутам DRF.
+
+    Маршрут — имя URL из resolver_match (например, recipes-list
+    или users-subscriptions), запросы без маршрута учитываются
+    как unmatched, чтобы число рядов метрик не росло от путей.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS['ENABLED']:
+            return self.get_response(request)
+        metrics.store.start(metrics.registry)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(counter)
+                )
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.url_name if match and match.url_name else 'unmatched'
+        metrics.registry.observe('http_request_duration_seconds', {
+            'route': route,
+            'method': request.method,
+            'status': str(response.status_code),
+        }, duration)
+        metrics.registry.observe(
+            'http_request_db_queries', {'route': route}, counter.count
+        )
+        metrics.registry.observe(
+            'http_request_db_duration_seconds', {'route': route},
+            counter.duration
+        )
+        return response
+
+
+class InstrumentationMiddleware:
+    '''Замеры запросов: SQL, время представления и отрисовки ответа.
+
+    Для доли запросов INSTRUMENTATION['SAMPLE_RATE'] считаются SQL-запросы
+    всех подключений, повторяющиеся запросы (признак N+1), время работы
+    представления без БД (в основном сериализация) и отрисовки ответа.
+    Результат отдается в заголовке Server-Timing и пишется в журнал
+    api.instrumentation. Запросы дольше SLOW_REQUEST_MS пишутся
+    в журнал всегда, с текстом SQL — если запрос попал в выборку.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = settings.INSTRUMENTATION
+        start = time.perf_counter()
+        if random.random() >= config['SAMPLE_RATE']:
+            response = self.get_response(request)
+            total = time.perf_counter() - start
+            if total * 1000 >= config['SLOW_REQUEST_MS']:
+                self.log(logging.WARNING, request, response, {
+                    'sampled': False, 'total_ms': round(total * 1000, 3),
+                })
+            return response
+
+        recorder = QueryRecorder(config['CAPTURE_SQL_LIMIT'])
+        request._instrumentation_view_end = None
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(recorder)
+                )
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        view_end = request._instrumentation_view_end or end
+        metrics = {
+            'total': end - start,
+            'db': recorder.duration,
+            'app': max(view_end - start - recorder.duration, 0),
+            'render': end - view_end,
+        }
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.1f}'
+            + (f';desc="{recorder.count} queries"' if name == 'db' else '')
+            for name, duration in metrics.items()
+        )
+        duplicates = recorder.duplicates(config['DUPLICATE_THRESHOLD'])
+        data = {
+            'sampled': True,
+            **{
+                f'{name}_ms': round(duration * 1000, 3)
+                for name, duration in metrics.items()
+            },
+            'queries': recorder.count,
+            'duplicates': duplicates,
+        }
+        slow = metrics['total'] * 1000 >= config['SLOW_REQUEST_MS']
+        if slow:
+            data['sql'] = recorder.captured
+        self.log(
+            logging.WARNING if slow or duplicates else logging.INFO,
+            request, response, data
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        # Вызывается после представления и до отрисовки ответа.
+        request._instrumentation_view_end = time.perf_counter()
+        return response
+
+    def log(self, level, request, response, data):
+        match = getattr(request, 'resolver_match', None)
+        logger.log(level, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            **data,
+        }, ensure_ascii=False))
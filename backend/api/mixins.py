@@ -1,4 +1,15 @@
-from rest_framework import mixins, viewsets
+from hashlib import md5
+
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date, quote_etag
+from rest_framework import mixins, status, viewsets
+from rest_framework.response import Response
+
+from api import metrics
+from api.cache import response_cache
+from recipes.versions import INITIAL_VERSION, get_versions
 
 
 class ListCreateRetrieveViewSet(
@@ -8,3 +19,115 @@ class ListCreateRetrieveViewSet(
     viewsets.GenericViewSet
 ):
     pass
+
+
+class ConditionalMixin:
+    '''Условные GET-запросы (ETag и Last-Modified) для list и retrieve.
+
+    Если версии ресурсов не изменились, возвращается 304 Not Modified
+    без обращения к БД и сериализации.
+    '''
+
+    conditional_actions = ('list', 'retrieve')
+    version_resources = ()
+    conditional_private = False
+
+    def get_version_resources(self):
+        '''Ресурсы, от которых зависит ответ.
+
+        Может вызвать Http404: для несуществующего объекта версии
+        не вычисляются.
+        '''
+        return self.version_resources
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+        resources = self.get_version_resources()
+        versions = get_versions(resources)
+        # Обработчик может согласовать ответ с теми же версиями.
+        self.versions = dict(zip(resources, versions))
+        etag = quote_etag(md5(
+            repr(list(zip(resources, versions))).encode()
+        ).hexdigest())
+        last_modified = max(versions)
+        if last_modified == INITIAL_VERSION:
+            last_modified = None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        metrics.inc('conditional_requests_total', {
+            'result': 'modified' if response is None else 'not_modified'
+        })
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if self.conditional_private:
+            patch_cache_control(response, no_cache=True, private=True)
+            patch_vary_headers(response, ('Authorization',))
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class AnonymousCacheMixin:
+    '''Кэш ответов list и retrieve для анонимных пользователей.
+
+    Ключ строится из get_cache_params(), ответ регистрируется
+    в индексах get_cache_dependencies() для точечной инвалидации.
+    '''
+
+    cached_actions = ('list', 'retrieve')
+
+    def get_cache_params(self):
+        return self.request.query_params.lists()
+
+    def get_cache_dependencies(self, params):
+        return ()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if (
+            self.action not in self.cached_actions
+            or request.user.is_authenticated
+        ):
+            return handler(request, *args, **kwargs)
+        params = tuple(self.get_cache_params())
+        key = response_cache.make_key(
+            self.basename, self.action, request.build_absolute_uri('/'),
+            kwargs, params
+        )
+        data = response_cache.get(key)
+        metrics.inc('response_cache_requests_total', {
+            'result': 'miss' if data is None else 'hit'
+        })
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(
+                key, response.data, self.get_cache_dependencies(params)
+            )
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
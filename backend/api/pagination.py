@@ -1,6 +1,172 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework import exceptions
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CountPaginator(Paginator):
+    '''Paginator с настраиваемым подсчетом общего числа объектов.
+
+    Режим задается PAGINATION_COUNT_MODE: exact — COUNT(*) на каждый
+    запрос, cached — COUNT(*) кэшируется на PAGINATION_COUNT_TIMEOUT
+    секунд, approximate — оценка планировщика PostgreSQL для больших
+    выборок.
+    '''
+
+    @cached_property
+    def count(self):
+        mode = settings.PAGINATION_COUNT_MODE
+        if mode == 'cached':
+            return self.cached_count()
+        if mode == 'approximate':
+            return self.approximate_count()
+        return super().count
+
+    def cached_count(self):
+        sql, params = self.object_list.query.sql_with_params()
+        key = 'pagination_count:' + md5(
+            repr((self.object_list.db, sql, params)).encode()
+        ).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.PAGINATION_COUNT_TIMEOUT)
+        return count
+
+    def approximate_count(self):
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+        sql, params = self.object_list.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]['Plan']['Plan Rows']
+        if estimate < settings.PAGINATION_APPROXIMATE_COUNT_THRESHOLD:
+            # Для небольших выборок оценка неточна, а COUNT(*) дешев.
+            return super().count
+        return estimate
 
 
 class CustomPageNumberPagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
+    django_paginator_class = CountPaginator
+
+
+class RecipePagination(CustomPageNumberPagination):
+    '''Постраничная выдача рецептов с режимом курсора.
+
+    Если в запросе есть параметр cursor (в том числе пустой), выдача
+    строится по ключу сортировки (по умолчанию (pub_date, id))
+    без COUNT(*) и OFFSET: ответ
+    содержит только ссылку next и результаты. Без параметра работает
+    обычная постраничная выдача page / limit. Курсор несовместим
+    с параметрами, задающими свою сортировку (search сортирует
+    по релевантности), такие запросы отклоняются с ошибкой 400.
+    '''
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+    keyset_incompatible_params = ('search',)
+    keyset_incompatible_message = 'Курсор нельзя совмещать с параметром {}'
+    # Сортировки, по которым возможен курсор; первая — по умолчанию.
+    keyset_orderings = (
+        ('-pub_date', '-id'),
+        ('-favorites_count', '-pub_date', '-id'),
+    )
+
+    def get_keyset_ordering(self, queryset):
+        ordering = tuple(queryset.query.order_by)
+        if ordering in self.keyset_orderings:
+            return ordering
+        return self.keyset_orderings[0]
+
+    def get_keyset_fields(self, queryset, ordering):
+        return [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in ordering
+        ]
+
+    def encode_cursor(self, recipe, fields):
+        position = '|'.join(field.value_to_string(recipe) for field in fields)
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor, fields):
+        try:
+            values = urlsafe_b64decode(cursor).decode().split('|')
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                field.to_python(value)
+                for field, value in zip(fields, values)
+            ]
+        except (DecodeError, UnicodeDecodeError, ValueError,
+                ValidationError):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+
+    def keyset_filter(self, fields, values):
+        # Все поля сортируются по убыванию: строка идет после курсора,
+        # если первое отличающееся поле у нее меньше.
+        condition, equal = Q(), {}
+        for field, value in zip(fields, values):
+            condition |= Q(**equal, **{f'{field.attname}__lt': value})
+            equal[field.attname] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor = request.query_params.get(self.cursor_query_param)
+        self.keyset = cursor is not None
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        for param in self.keyset_incompatible_params:
+            if request.query_params.get(param):
+                raise exceptions.ValidationError({self.cursor_query_param: [
+                    self.keyset_incompatible_message.format(param)
+                ]})
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_keyset_ordering(queryset)
+        fields = self.get_keyset_fields(queryset, ordering)
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            queryset = queryset.filter(self.keyset_filter(
+                fields, self.decode_cursor(cursor, fields)
+            ))
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = (
+            self.encode_cursor(page[page_size - 1], fields)
+            if len(page) > page_size else None
+        )
+        return page[:page_size]
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'results': data})
@@ -0,0 +1,86 @@
+import csv
+import json
+
+from rest_framework import renderers
+
+
+class Echo:
+    '''Буфер для csv.writer, который сразу возвращает записанную строку.'''
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    '''Базовый рендерер списка покупок.
+
+    Строки списка отдаются по одной через stream(), поэтому весь файл
+    не собирается в памяти.
+    '''
+
+    charset = 'utf-8'
+
+    def stream(self, data):
+        raise NotImplementedError(
+            'Метод stream() должен быть переопределен'
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # Сообщения об ошибках (401, 405 и т.п.) отдаются как JSON.
+            return renderers.JSONRenderer().render(data)
+        return ''.join(self.stream(data)).encode(self.charset)
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, data):
+        separator = ''
+        for ingredient in data:
+            yield separator + '{name} ({unit}) - {amount}'.format(
+                name=ingredient['ingredient__name'],
+                unit=ingredient['ingredient__measurement_unit'],
+                amount=ingredient['amount']
+            )
+            separator = '\n'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, data):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Единица измерения', 'Количество')
+        )
+        for ingredient in data:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['ingredient__measurement_unit'],
+                ingredient['amount'],
+            ))
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, data):
+        separator = ''
+        yield '['
+        for ingredient in data:
+            yield separator + json.dumps(
+                {
+                    'name': ingredient['ingredient__name'],
+                    'measurement_unit': (
+                        ingredient['ingredient__measurement_unit']
+                    ),
+                    'amount': ingredient['amount'],
+                },
+                ensure_ascii=False
+            )
+            separator = ','
+        yield ']'
@@ -1,10 +1,13 @@
 from django.conf import settings
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from djoser.serializers import SetPasswordSerializer
 from rest_framework import serializers
 
-from api.fields import Base64ImageField
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from api.fields import Base64ImageField, ImageRenditionField
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, Tag
+)
+from recipes.signals import recipe_ingredients_changed
 from users.models import User
 
 
@@ -19,9 +22,12 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return (
             user.is_authenticated
+            and user != obj
             and obj.following.filter(user=user).exists()
         )
 
@@ -50,7 +56,7 @@ class ResetPasswordSerializer(SetPasswordSerializer):
 
 class SubscriptionSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + (
@@ -59,31 +65,23 @@ class SubscriptionSerializer(UserSerializer):
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
     def get_recipes(self, obj):
-        recipes_limit = self.context['request'].GET.get(
-            'recipes_limit', settings.RECIPES_LIMIT
-        )
-        recipes = obj.recipes.all()[:int(recipes_limit)]
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            recipes_limit = self.context['request'].GET.get(
+                'recipes_limit', settings.RECIPES_LIMIT
+            )
+            recipes = obj.recipes.all()[:int(recipes_limit)]
         serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
-    def validate(self, data):
-        if self.context['request'].method != 'POST':
-            return data
-        user = self.context['request'].user
-        author_id = self.context['request'].parser_context['kwargs']['pk']
-        author = get_object_or_404(User, id=author_id)
-        if user.follower.filter(author=author_id).exists():
-            raise serializers.ValidationError(
-                'Подписка уже существует'
-            )
-        if user == author:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя'
-            )
-        return data
+
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE
+    )
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -145,15 +143,19 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_medium = ImageRenditionField('medium')
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'name', 'image', 'image_medium', 'text',
+            'cooking_time',
         )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -161,6 +163,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -186,38 +190,99 @@ class RecipeCreateUpdateSerializer(RecipeSerializer):
             for ingredient in ingredients
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredient)
-
+        return recipe_ingredient
+
+    def cache_related(self, recipe, tags, recipe_ingredient):
+        '''Кладет теги и ингредиенты в кэш prefetch_related рецепта.
+
+        Ответ на запрос строится из уже проверенных объектов
+        без повторных запросов к БД. Теги сортируются по id, как в ответе
+        на GET, ингредиенты идут в порядке запроса.
+        '''
+        cache = recipe.__dict__.setdefault('_prefetched_objects_cache', {})
+        for related_name, objects in (
+            ('tags', sorted(tags, key=lambda tag: tag.id)),
+            ('recipeingredient', recipe_ingredient),
+        ):
+            queryset = getattr(recipe, related_name).all()
+            queryset._result_cache = objects
+            queryset._prefetch_done = True
+            cache[related_name] = queryset
+
+    def update_recipe_ingredient(self, recipe, ingredients):
+        '''Приводит ингредиенты рецепта к новому составу.
+
+        Добавляются, изменяются и удаляются только отличающиеся строки.
+        Возвращает итоговый список и признак того, что состав изменился.
+        '''
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipeingredient.all()
+        }
+        recipe_ingredient, created, updated = [], [], []
+        for ingredient in ingredients:
+            obj = current.pop(ingredient['ingredient'].id, None)
+            if obj is None:
+                obj = RecipeIngredient(
+                    recipe=recipe, amount=ingredient['amount']
+                )
+                created.append(obj)
+            elif obj.amount != ingredient['amount']:
+                obj.amount = ingredient['amount']
+                updated.append(obj)
+            obj.ingredient = ingredient['ingredient']
+            recipe_ingredient.append(obj)
+        if current:
+            RecipeIngredient.objects.filter(
+                pk__in=[obj.pk for obj in current.values()]
+            ).delete()
+        RecipeIngredient.objects.bulk_create(created)
+        RecipeIngredient.objects.bulk_update(updated, ('amount',))
+        return recipe_ingredient, bool(current or created or updated)
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipeingredient')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        self.set_recipe_ingredient(recipe, ingredients)
+        recipe_ingredient = self.set_recipe_ingredient(recipe, ingredients)
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
+        self.saved_related = (tags, recipe_ingredient)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipeingredient')
-        instance.ingredients.clear()
-        instance.tags.clear()
         super().update(instance, validated_data)
         instance.tags.set(tags)
-        self.set_recipe_ingredient(instance, ingredients)
+        recipe_ingredient, changed = self.update_recipe_ingredient(
+            instance, ingredients
+        )
+        if changed:
+            transaction.on_commit(
+                lambda: recipe_ingredients_changed.send(
+                    sender=Recipe, recipes=[instance.pk]
+                )
+            )
+        self.saved_related = (tags, recipe_ingredient)
         return instance
 
     def to_representation(self, instance):
+        if hasattr(self, 'saved_related'):
+            # UpdateModelMixin сбрасывает кэш prefetch_related после
+            # сохранения, поэтому он заполняется перед сериализацией.
+            self.cache_related(instance, *self.saved_related)
         data = super().to_representation(instance)
-        tag_list = []
-        for tag_id in data['tags']:
-            tag = get_object_or_404(Tag, id=tag_id)
-            tag_list.append(TagSerializer(tag).data)
-        data['tags'] = tag_list
+        data['tags'] = TagSerializer(instance.tags.all(), many=True).data
         return data
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_thumbnail = ImageRenditionField('thumbnail')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_thumbnail', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
@@ -0,0 +1,104 @@
+import time
+
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api import metrics
+from api.authentication import token_cache
+from api.cache import clear_on_commit, invalidate_recipe
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.signals import recipe_ingredients_changed
+from users.models import User
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(pre_delete, sender=Recipe)
+def invalidate_recipe_responses(sender, instance, **kwargs):
+    # При удалении теги рецепта еще доступны только до удаления.
+    invalidate_recipe(instance)
+
+
+@receiver(recipe_ingredients_changed)
+def invalidate_recipe_ingredients_responses(sender, recipes, **kwargs):
+    for recipe in Recipe.objects.filter(pk__in=recipes):
+        invalidate_recipe(recipe)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_responses(sender, instance, action, reverse,
+                                     **kwargs):
+    if reverse:
+        clear_on_commit()
+    elif action in ('pre_clear', 'pre_remove', 'post_add'):
+        invalidate_recipe(instance)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def clear_responses(sender, **kwargs):
+    clear_on_commit()
+
+
+@receiver(post_save, sender=User)
+def clear_author_responses(sender, instance, created, update_fields,
+                           **kwargs):
+    if created or update_fields and set(update_fields) == {'last_login'}:
+        return
+    clear_on_commit()
+
+
+@receiver(post_delete, sender=Token)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.invalidate_user(
+        instance.pk if sender is User else instance.user_id
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_changed_user_tokens(sender, instance, created, update_fields,
+                                   **kwargs):
+    # Смена пароля, деактивация и другие изменения пользователя.
+    if created or update_fields and set(update_fields) == {'last_login'}:
+        return
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(request_started)
+def check_persistent_connections(**kwargs):
+    '''Закрывает постоянные подключения, которые разорвал сервер БД.
+
+    Аналог CONN_HEALTH_CHECKS из Django 4.1: без проверки первый запрос
+    после перезапуска PostgreSQL или pgbouncer завершился бы ошибкой.
+    Чтобы не добавлять SELECT 1 к каждому запросу, подключение
+    проверяется не чаще раза в CONN_HEALTH_CHECK_INTERVAL секунд.
+    '''
+    now = time.monotonic()
+    for connection in connections.all():
+        settings_dict = connection.settings_dict
+        if (
+            connection.connection is None
+            or not settings_dict.get('CONN_HEALTH_CHECKS')
+            or connection.in_atomic_block
+            or now - getattr(connection, 'health_checked_at', 0)
+            < settings_dict.get('CONN_HEALTH_CHECK_INTERVAL', 0)
+        ):
+            continue
+        connection.health_checked_at = now
+        if not connection.is_usable():
+            connection.close()
+
+
+@receiver(connection_created)
+def count_connections(sender, connection, **kwargs):
+    metrics.inc('db_connections_total', {'alias': connection.alias})
+    # Только что открытое подключение проверять не нужно.
+    connection.health_checked_at = time.monotonic()
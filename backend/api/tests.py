@@ -0,0 +1,352 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.cache import response_cache
+from api.serializers import RecipeCreateUpdateSerializer
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, ResourceVersion, ShoppingListItem,
+    Tag
+)
+from users.models import User
+
+
+def make_image():
+    buffer = BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+class RecipeListQueriesTest(TestCase):
+    '''Число запросов списка рецептов не зависит от размера страницы.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader', password='pass'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', color=f'#00000{number}',
+                               slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count):
+        start = Recipe.objects.count()
+        for number in range(start, start + count):
+            author = User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}', password='pass'
+            )
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10, image='recipes/images/recipe.jpg'
+            )
+            recipe.tags.set(self.tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in self.ingredients
+            )
+
+    def count_queries(self, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_page(self):
+        self.create_recipes(2)
+        queries = self.count_queries(2)
+        self.create_recipes(8)
+        self.assertEqual(self.count_queries(10), queries)
+
+
+class RecipeWriteResponseQueriesTest(TestCase):
+    '''Ответ на POST и PATCH строится без запросов к БД.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', color=f'#00000{number}',
+                               slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.request = APIRequestFactory().post('/api/recipes/')
+        self.request.user = self.user
+
+    def payload(self, tags, ingredients):
+        return {
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': number + 1}
+                for number, ingredient in enumerate(ingredients)
+            ],
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': make_image(),
+        }
+
+    def save(self, data, instance=None):
+        serializer = RecipeCreateUpdateSerializer(
+            instance, data=data, partial=instance is not None,
+            context={'request': self.request}
+        )
+        serializer.is_valid(raise_exception=True)
+        recipe = serializer.save(author=self.user)
+        # Так поступает UpdateModelMixin после сохранения.
+        recipe._prefetched_objects_cache = {}
+        return serializer
+
+    def assertRepresentation(self, serializer, tags, ingredients):
+        with self.assertNumQueries(0):
+            data = serializer.data
+        self.assertEqual([tag['id'] for tag in data['tags']],
+                         [tag.id for tag in tags])
+        self.assertEqual(
+            [(item['id'], item['name']) for item in data['ingredients']],
+            [(ingredient.id, ingredient.name) for ingredient in ingredients]
+        )
+
+    def test_create_response(self):
+        tags, ingredients = self.tags[:2], self.ingredients[:3]
+        # Теги в ответе упорядочены по id независимо от порядка в запросе.
+        serializer = self.save(self.payload(tags[::-1], ingredients))
+        self.assertRepresentation(serializer, tags, ingredients)
+        self.assertFalse(serializer.data['is_favorited'])
+
+    def test_update_response(self):
+        recipe = self.save(
+            self.payload(self.tags[:2], self.ingredients[:3])
+        ).instance
+        tags, ingredients = self.tags[1:], self.ingredients[2:]
+        data = self.payload(tags, ingredients)
+        del data['image']
+        serializer = self.save(
+            data, Recipe.objects.with_user_flags(self.user).get(pk=recipe.pk)
+        )
+        self.assertRepresentation(serializer, tags, ingredients)
+
+
+class ConditionalVersionsTest(TestCase):
+    '''Условные GET-запросы не создают строк версий.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            cooking_time=10, image='recipes/images/recipe.jpg'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_missing_recipes_do_not_create_versions(self):
+        versions = ResourceVersion.objects.count()
+        for pk in ('999999', '1' * 120, 'abc'):
+            response = self.client.get(f'/api/recipes/{pk}/')
+            self.assertEqual(response.status_code, 404)
+        self.client.get('/api/tags/')
+        self.assertEqual(ResourceVersion.objects.count(), versions)
+
+    def test_deleted_recipe_is_not_found(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.recipe.delete()
+        self.assertFalse(ResourceVersion.objects.filter(
+            resource=f'recipe:{self.recipe.pk}').exists())
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404
+        )
+
+
+class ResponseCacheInvalidationTest(TestCase):
+    '''Кэш ответов сбрасывается только после фиксации транзакции.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            cooking_time=10, image='recipes/images/recipe.jpg'
+        )
+
+    def setUp(self):
+        response_cache.clear()
+
+    def recipe_name(self):
+        response = APIClient().get(f'/api/recipes/{self.recipe.pk}/')
+        return response.data['name']
+
+    def test_eviction_waits_for_commit(self):
+        self.assertEqual(self.recipe_name(), 'Рецепт')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+            # Ответ, закэшированный до фиксации, еще старый.
+            self.assertEqual(self.recipe_name(), 'Рецепт')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.recipe_name(), 'Новое название')
+
+
+class ShoppingCartAsgiExportTest(TestCase):
+    '''Список покупок выгружается целиком и через ASGIHandler.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user=cls.user, total_amount=number + 1,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {number}', measurement_unit='г'
+                )
+            )
+            for number in range(3)
+        )
+
+    def setUp(self):
+        # Как и тестовый клиент, не даем сигналам запроса закрыть
+        # соединение с транзакцией теста.
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+
+    async def export(self):
+        communicator = ApplicationCommunicator(ASGIHandler(), {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/recipes/download_shopping_cart/',
+            'query_string': b'',
+            'headers': [
+                (b'authorization', f'Token {self.token.key}'.encode()),
+            ],
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output()
+        body = b''
+        while True:
+            message = await communicator.receive_output()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return start['status'], body.decode()
+
+    def test_export(self):
+        status, body = async_to_sync(self.export)()
+        self.assertEqual(status, 200)
+        self.assertEqual(body, '\n'.join(
+            f'Ингредиент {number} (г) - {number + 1}' for number in range(3)
+        ))
+
+
+class LinkToggleQueriesTest(TestCase):
+    '''Число запросов переключателей избранного, корзины и подписок.
+
+    Сама связь в PostgreSQL меняется одним запросом, остальные делают
+    обработчики сигналов и построение ответа.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader', password='pass'
+        )
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            cooking_time=10, image='recipes/images/recipe.jpg'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        if connection.vendor == 'postgresql':
+            self.add_queries, self.remove_queries = 1, 1
+        else:
+            # Проверка объекта, INSERT в точке сохранения;
+            # выборка и удаление связей.
+            self.add_queries, self.remove_queries = 4, 2
+
+    def assertToggleQueries(self, url, added, removed):
+        # Еще два запроса — точка сохранения @transaction.atomic
+        # представления внутри транзакции теста.
+        with self.assertNumQueries(2 + self.add_queries + added):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(2 + self.remove_queries + removed):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+
+    def test_favorite(self):
+        # Счетчик, версия пользователя (2), рецепт для ответа.
+        self.assertToggleQueries(
+            f'/api/recipes/{self.recipe.pk}/favorite/', 4, 3
+        )
+
+    def test_shopping_cart(self):
+        # Кроме того, пересчет списка покупок в точке сохранения (5).
+        self.assertToggleQueries(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/', 9, 8
+        )
+
+    def test_subscribe(self):
+        # Счетчик, версия пользователя (2), автор и его рецепты для ответа.
+        self.assertToggleQueries(
+            f'/api/users/{self.author.pk}/subscribe/', 5, 3
+        )
@@ -2,7 +2,10 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from django.views.generic import TemplateView
 
-from api.views import TagViewSet, IngredientViewSet, RecipeViewSet, UserViewSet
+from api.views import (
+    TagViewSet, IngredientViewSet, RecipeViewSet, TokenCacheStatsView,
+    UserViewSet
+)
 
 
 router_v1 = DefaultRouter()
@@ -16,6 +19,11 @@ app_name = 'api'
 urlpatterns = [
     path('', include(router_v1.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path(
+        'auth/token/cache/',
+        TokenCacheStatsView.as_view(),
+        name='token_cache'
+    ),
     path(
         'docs/',
         TemplateView.as_view(template_name='redoc.html'),
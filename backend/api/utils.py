@@ -1,21 +1,12 @@
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
 
-def make_file(data, filename, http_status):
-    product_list = []
-    for ingredient in data:
-        product_list.append(
-            '{name} ({unit}) - {amount}'.format(
-                name=ingredient['ingredient__name'],
-                unit=ingredient['ingredient__measurement_unit'],
-                amount=ingredient['amount']
-            )
-        )
-    response = HttpResponse(
-        content='\n'.join(product_list),
-        content_type='text/plain',
+def make_file(data, renderer, filename, http_status):
+    response = StreamingHttpResponse(
+        renderer.stream(data),
+        content_type=f'{renderer.media_type}; charset={renderer.charset}',
         status=http_status
     )
     response['Content-Disposition'] = (
-        f'attachment; filename={filename}')
+        f'attachment; filename={filename}.{renderer.format}')
     return response
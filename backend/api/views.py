@@ -1,28 +1,93 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
 
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api import metrics
+from api.authentication import token_cache
 from api.filters import IngredientFilter, RecipeFilter
-from api.mixins import ListCreateRetrieveViewSet
+from api.mixins import (
+    AnonymousCacheMixin, ConditionalMixin, ListCreateRetrieveViewSet
+)
+from api.pagination import RecipePagination
 from api.permissions import AccessOrReadOnly
+from api.renderers import (
+    CSVShoppingListRenderer, JSONShoppingListRenderer,
+    TextShoppingListRenderer
+)
 from api.serializers import (
-    IngredientSerializer, RecipeCreateUpdateSerializer, RecipeSerializer,
-    RecipeShortSerializer, ResetPasswordSerializer,
+    BatchSerializer, IngredientSerializer, RecipeCreateUpdateSerializer,
+    RecipeSerializer, RecipeShortSerializer, ResetPasswordSerializer,
     SubscriptionSerializer, TagSerializer,
     UserCreateSerializer, UserSerializer
 )
 from api.utils import make_file
+from recipes.autocomplete import ingredient_index
 from recipes.models import (
-    FavoriteRecipe, Ingredient, Recipe,
-    RecipeIngredient, ShoppingCart, Tag
+    FavoriteRecipe, Ingredient, Recipe, ShoppingCart, Tag
 )
 from users.models import Follow, User
 
 
+# Наибольшее значение BigAutoField.
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_id(pk):
+    '''Идентификатор объекта из адреса; 404, если это не id.'''
+    try:
+        pk = int(pk)
+    except ValueError:
+        raise Http404
+    if not 0 < pk <= MAX_ID:
+        raise Http404
+    return pk
+
+
+@transaction.atomic
+def change_links(request, model, target_model, rejected=None):
+    '''Пакетное добавление (POST) или удаление (DELETE) связей.
+
+    Для каждого id возвращается статус: added или exists при
+    добавлении, removed или absent при удалении, not_found для
+    несуществующих объектов; rejected задает статусы id, которые
+    нельзя менять.
+    '''
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    rejected = rejected or {}
+    allowed = [pk for pk in ids if pk not in rejected]
+    if request.method == 'DELETE':
+        changed = model.objects.remove_many(request.user, allowed)
+        done, skipped = 'removed', 'absent'
+    else:
+        changed = model.objects.add_many(request.user, allowed)
+        done, skipped = 'added', 'exists'
+    unchanged = set(allowed) - changed
+    found = set(target_model.objects.filter(
+        pk__in=unchanged).values_list('pk', flat=True)) if unchanged else ()
+    return Response({'results': [
+        {
+            'id': pk,
+            'status': (
+                rejected.get(pk)
+                or (done if pk in changed else None)
+                or (skipped if pk in found else 'not_found')
+            ),
+        }
+        for pk in ids
+    ]})
+
+
 class UserViewSet(ListCreateRetrieveViewSet):
     queryset = User.objects.all()
 
@@ -33,6 +98,12 @@ class UserViewSet(ListCreateRetrieveViewSet):
             return UserCreateSerializer
         return UserSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return queryset.with_is_subscribed(self.request.user)
+        return queryset
+
     def get_permissions(self):
         if self.action == 'retrieve':
             return (permissions.IsAuthenticated(),)
@@ -57,7 +128,7 @@ class UserViewSet(ListCreateRetrieveViewSet):
         serializer.is_valid(raise_exception=True)
         new_password = serializer.validated_data.get('new_password')
         self.request.user.set_password(new_password)
-        self.request.user.save()
+        self.request.user.save(update_fields=('password',))
         return Response(
             {'status': 'password set'}, status=status.HTTP_204_NO_CONTENT
         )
@@ -67,7 +138,19 @@ class UserViewSet(ListCreateRetrieveViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
+        recipes_limit = int(
+            request.GET.get('recipes_limit', settings.RECIPES_LIMIT)
+        )
+        queryset = (
+            User.objects.filter(following__user=request.user)
+            .with_is_subscribed(request.user)
+            .order_by('id')
+            .prefetch_related(Prefetch(
+                'recipes',
+                queryset=Recipe.objects.latest_per_author(recipes_limit),
+                to_attr='recipes_preview'
+            ))
+        )
         page = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
             page, many=True, context={'request': request}
@@ -79,46 +162,158 @@ class UserViewSet(ListCreateRetrieveViewSet):
         methods=('post', 'delete'),
         permission_classes=(permissions.IsAuthenticated,)
     )
+    @transaction.atomic
     def subscribe(self, request, pk):
         user = request.user
-        author = get_object_or_404(User, id=pk)
+        pk = parse_id(pk)
         if request.method == 'DELETE':
-            if not Follow.objects.filter(user=user, author=author).exists():
-                return Response(
-                    {'error': 'Вы не были подписаны на данного пользователя'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            get_object_or_404(Follow, user=user, author=author).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            if Follow.objects.remove(user, pk):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(User, id=pk)
+            return Response(
+                {'error': 'Вы не были подписаны на данного пользователя'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if pk == user.pk:
+            return Response(
+                {'non_field_errors': ['Нельзя подписаться на самого себя']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if Follow.objects.add(user, pk) is None:
+            get_object_or_404(User, id=pk)
+            return Response(
+                {'non_field_errors': ['Подписка уже существует']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         serializer = SubscriptionSerializer(
-            author, data=request.data, context={'request': request}
+            User.objects.with_is_subscribed(user).get(id=pk),
+            context={'request': request}
         )
-        serializer.is_valid(raise_exception=True)
-        Follow.objects.create(user=user, author=author)
         return Response(serializer.data,
                         status=status.HTTP_201_CREATED)
 
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        url_path='subscribe',
+        url_name='subscribe-batch',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def subscribe_batch(self, request):
+        return change_links(
+            request, Follow, User, rejected={request.user.pk: 'self'}
+        )
+
+
+class TokenCacheStatsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(token_cache.stats())
+
+
+def metrics_view(request):
+    '''Метрики для Prometheus, собранные со всех рабочих процессов.
+
+    Адрес не проксируется nginx и доступен только внутри сети
+    контейнеров.
+    '''
+    if not settings.METRICS['ENABLED']:
+        raise Http404
+    return HttpResponse(
+        metrics.export(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    version_resources = ('tags',)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
+    version_resources = ('ingredients',)
+
+    def search(self, request, name):
+        limit = settings.INGREDIENTS_SEARCH_LIMIT
+        ingredients = ingredient_index.search(
+            name, limit, self.versions['ingredients']
+        )
+        if not ingredients:
+            # Поиск по подстроке и опечаткам — только если ни одно
+            # название не начинается с введенного текста.
+            ingredients = self.get_serializer(
+                self.get_queryset().search(name)[:limit], many=True
+            ).data
+        return Response(ingredients)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientFilter.search_param)
+        if name:
+            return self.conditional_response(self.search, request, name)
+        return super().list(request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(
+    ConditionalMixin, AnonymousCacheMixin, viewsets.ModelViewSet
+):
     http_method_names = ('get', 'post', 'patch', 'delete')
     queryset = Recipe.objects.all()
     permission_classes = (AccessOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+    conditional_actions = ('retrieve',)
+    conditional_private = True
+
+    def get_version_resources(self):
+        pk = parse_id(self.kwargs['pk'])
+        if not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        resources = ('tags', 'ingredients', f'recipe:{pk}')
+        if self.request.user.is_authenticated:
+            resources += (f'user:{self.request.user.pk}',)
+        return resources
+
+    def get_cache_params(self):
+        params = self.request.query_params
+        pagination_params = (
+            self.paginator.page_query_param,
+            self.paginator.page_size_query_param,
+            self.paginator.cursor_query_param,
+        )
+        return (
+            ('tags', tuple(sorted(set(params.getlist('tags'))))),
+        ) + tuple(
+            (name, params[name].strip() if name in params else None)
+            for name in (*RecipeFilter.base_filters, *pagination_params)
+            if name != 'tags'
+        )
+
+    def get_cache_dependencies(self, params):
+        if self.action == 'retrieve':
+            return (f'recipe:{self.kwargs["pk"]}',)
+        params = dict(params)
+        if params['author']:
+            return (f'author:{params["author"]}',)
+        if params['tags']:
+            return tuple(f'tag:{slug}' for slug in params['tags'])
+        return ('all',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return queryset.for_list(self.request.user)
+        if self.action == 'partial_update':
+            return queryset.with_user_flags(self.request.user)
+        return queryset
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -131,22 +326,29 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
     def favorite_or_shopping_cart(self, request, model, pk):
+        # Наличие рецепта проверяется отдельно, только если связь
+        # не удалось создать или удалить.
         user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
+        pk = parse_id(pk)
         if request.method == 'DELETE':
-            if not model.objects.filter(user=user, recipe=recipe).exists():
-                return Response(
-                    {'error': 'Рецепт не найден'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            get_object_or_404(model, user=user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            if model.objects.remove(user, pk):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(Recipe, id=pk)
+            return Response(
+                {'error': 'Рецепт не найден'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if model.objects.add(user, pk) is None:
+            get_object_or_404(Recipe, id=pk)
+            return Response(
+                {'error': 'Рецепт уже добавлен'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         serializer = RecipeShortSerializer(
-            recipe, data=request.data, context={'request': request}
+            Recipe.objects.get(id=pk), context={'request': request}
         )
-        serializer.is_valid(raise_exception=True)
-        model.objects.create(user=user, recipe=recipe)
         return Response(serializer.data,
                         status=status.HTTP_201_CREATED)
 
@@ -166,22 +368,55 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk):
         return self.favorite_or_shopping_cart(request, ShoppingCart, pk)
 
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def favorite_batch(self, request):
+        return change_links(request, FavoriteRecipe, Recipe)
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def shopping_cart_batch(self, request):
+        return change_links(request, ShoppingCart, Recipe)
+
     @action(
         detail=False,
         permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=(
+            TextShoppingListRenderer,
+            CSVShoppingListRenderer,
+            JSONShoppingListRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        recipes = request.user.shoppingcart.all().values('recipe__id')
-        ingredients = RecipeIngredient.objects.filter(recipe__in=recipes)
+        ingredients = request.user.shoppinglistitem.all()
 
-        if not ingredients:
-            return Response(
+        if not ingredients.exists():
+            return JsonResponse(
                 {'errors': 'Список покупок пустой'},
-                status=status.HTTP_204_NO_CONTENT
+                status=status.HTTP_204_NO_CONTENT,
+                json_dumps_params={'ensure_ascii': False}
             )
         total_ingredients = ingredients.values(
-            'ingredient__name', 'ingredient__measurement_unit').order_by(
-            'ingredient__name').annotate(amount=Sum('amount'))
+            'ingredient__name', 'ingredient__measurement_unit',
+            amount=F('total_amount')).order_by('ingredient__name')
+        rows = total_ingredients.iterator()
+        if isinstance(request._request, ASGIRequest):
+            # ASGIHandler Django 3.2 перебирает потоковый ответ в цикле
+            # событий, где запросы к БД запрещены: строки читаются сразу.
+            rows = list(total_ingredients)
         return make_file(
-            total_ingredients, 'shopping_cart.txt', status.HTTP_200_OK
+            rows,
+            request.accepted_renderer,
+            'shopping_cart',
+            status.HTTP_200_OK
         )
@@ -12,6 +12,13 @@ cp -r /app/collected_static/. /backend_static/
 echo "Apply migrations"
 python manage.py migrate
 
-# Start gunicorn server
+# Drop metrics snapshots left by previous workers
+rm -rf "${METRICS_DIR:-/tmp/foodgram_metrics}"
+
+# Start gunicorn server: sync WSGI workers or uvicorn ASGI workers,
+# tuned by gunicorn.conf.py
 echo "Start server"
-gunicorn --bind 0:8000 foodgram_backend.wsgi
\ No newline at end of file
+if [ "$SERVER_MODE" = "asgi" ]; then
+    exec gunicorn foodgram_backend.asgi:application
+fi
+exec gunicorn foodgram_backend.wsgi
\ No newline at end of file
@@ -0,0 +1,16 @@
+'''Какие бэкенды кэша Django общие для всех процессов сервера.
+
+Модуль не импортирует Django, его читает и gunicorn.conf.py.
+'''
+
+# У LocMemCache свой набор записей в каждом процессе, DummyCache ничего
+# не хранит.
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared(backend):
+    '''Видят ли записи кэша с бэкендом backend все процессы сервера.'''
+    return backend not in PROCESS_LOCAL_BACKENDS
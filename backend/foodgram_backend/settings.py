@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -56,6 +58,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,10 +98,98 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Persistent connections, checked before reuse at most once per
+        # CONN_HEALTH_CHECK_INTERVAL seconds.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+        ),
+        'CONN_HEALTH_CHECK_INTERVAL': float(
+            os.getenv('DB_CONN_HEALTH_CHECK_INTERVAL', 10)
+        ),
+        # Required behind pgbouncer in transaction pooling mode.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER') == 'True',
     }
 }
 
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+RECIPES_RESPONSE_CACHE = {
+    'BACKEND': os.getenv(
+        'RECIPES_CACHE_BACKEND', 'api.cache.LocalResponseCacheBackend'
+    ),
+    'OPTIONS': (
+        {'location': os.getenv('RECIPES_CACHE_LOCATION')}
+        if os.getenv('RECIPES_CACHE_LOCATION') else {}
+    ),
+    'TIMEOUT': int(os.getenv('RECIPES_CACHE_TIMEOUT', 60)),
+}
+
+# Per-request SQL and timing instrumentation (api.middleware)
+INSTRUMENTATION = {
+    'SAMPLE_RATE': float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', 0.05)),
+    'SLOW_REQUEST_MS': int(os.getenv('SLOW_REQUEST_MS', 500)),
+    'DUPLICATE_THRESHOLD': 3,
+    'CAPTURE_SQL_LIMIT': 100,
+}
+
+# Prometheus metrics (api.metrics), served at /metrics.
+# Worker snapshots are merged through files in DIRECTORY, which must be
+# shared by all gunicorn workers and emptied on server start.
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'True') == 'True',
+    'DIRECTORY': os.getenv(
+        'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_metrics')
+    ),
+    'FLUSH_INTERVAL': float(os.getenv('METRICS_FLUSH_INTERVAL', 1)),
+    'BUCKETS': {
+        'http_request_duration_seconds': (
+            0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+        ),
+        'http_request_db_queries': (0, 1, 2, 5, 10, 20, 50, 100),
+        'http_request_db_duration_seconds': (
+            0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1
+        ),
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.instrumentation': {
+            'handlers': ['console'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# In-process token cache of api.authentication.CachedTokenAuthentication.
+# Invalidation goes through the default cache, so the token cache is only
+# enabled when CACHE_BACKEND is shared by all processes.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 300))
+
+# Pagination count: exact, cached or approximate
+PAGINATION_COUNT_MODE = os.getenv('PAGINATION_COUNT_MODE', 'exact')
+PAGINATION_COUNT_TIMEOUT = int(os.getenv('PAGINATION_COUNT_TIMEOUT', 60))
+PAGINATION_APPROXIMATE_COUNT_THRESHOLD = 1000
+
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
 
@@ -121,7 +213,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPageNumberPagination',
@@ -157,3 +249,21 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 RECIPES_LIMIT = 3
+
+# Max ids in one batch favorite / shopping cart / subscribe request
+BATCH_MAX_SIZE = 100
+
+INGREDIENTS_SEARCH_LIMIT = 50
+INGREDIENTS_INDEX_TIMEOUT = 300
+
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', 5 * 1024 ** 2))
+# Картинки приходят в JSON в base64, поэтому тело запроса больше файла.
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + 1024 ** 2
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 25_000_000))
+IMAGE_RENDITIONS = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+}
+IMAGE_RENDITION_FORMATS = ('WEBP', 'JPEG')
+IMAGE_RENDITION_QUALITY = 80
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
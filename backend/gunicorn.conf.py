@@ -0,0 +1,67 @@
+'''Настройки gunicorn, каждую можно переопределить переменной окружения.
+
+Нескольким воркерам нужен общий кэш Django (CACHE_BACKEND): в нем
+хранятся кэш ответов и сброс кэша токенов. С кэшем по умолчанию
+(LocMemCache, свой в каждом процессе) запускается один воркер
+с потоками. Воркер uvicorn выполняет представления Django 3.2 в одном
+потоке, поэтому режим ASGI без общего кэша не запускается: один такой
+воркер обрабатывал бы запросы строго по очереди.
+'''
+
+import multiprocessing
+import os
+import sys
+
+# gunicorn не добавляет каталог проекта в sys.path до чтения настроек.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from foodgram_backend.cache_backends import is_shared  # noqa: E402
+
+SHARED_CACHE = is_shared(os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+))
+ASGI = os.getenv('SERVER_MODE') == 'asgi'
+
+if ASGI and not SHARED_CACHE:
+    raise RuntimeError(
+        'SERVER_MODE=asgi требует общего кэша: задайте CACHE_BACKEND '
+        '(например, Redis или Memcached) или используйте SERVER_MODE=wsgi'
+    )
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS',
+    multiprocessing.cpu_count() * 2 + 1 if SHARED_CACHE else 1
+))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+if ASGI:
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    worker_class = os.getenv(
+        'GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync'
+    )
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Периодический перезапуск воркеров ограничивает рост памяти, разброс
+# не дает им перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+
+
+def when_ready(server):
+    server.log.info(
+        'Воркеры: %s x %s (%s), общий кэш: %s',
+        workers, threads, worker_class, SHARED_CACHE
+    )
+    if workers > 1 and not SHARED_CACHE:
+        server.log.warning(
+            'Несколько воркеров с кэшем в памяти процесса: кэш ответов '
+            'сбрасывается только в своем воркере, задайте CACHE_BACKEND'
+        )
+    if ASGI and workers < 2:
+        server.log.warning(
+            'Один воркер uvicorn обрабатывает запросы по очереди, '
+            'увеличьте GUNICORN_WORKERS'
+        )
@@ -1,8 +1,10 @@
 from django.contrib import admin
 
 from recipes.models import (
-    Ingredient, Tag, Recipe, RecipeIngredient, FavoriteRecipe, ShoppingCart
+    Ingredient, Tag, Recipe, RecipeIngredient, FavoriteRecipe, ShoppingCart,
+    ShoppingListItem, StoredImage
 )
+from recipes.signals import recipe_ingredients_changed
 
 
 @admin.register(Ingredient)
@@ -21,7 +23,8 @@ class TagAdmin(admin.ModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
-        'id', 'name', 'author', 'cooking_time', 'pub_date'
+        'id', 'name', 'author', 'cooking_time', 'pub_date',
+        'favorites_count', 'in_carts_count'
     )
     search_fields = ('name', 'author')
     list_filter = ('name', 'author', 'tags', 'pub_date')
@@ -32,6 +35,22 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'recipe', 'ingredient', 'amount')
     list_filter = ('recipe', 'ingredient')
 
+    def ingredients_changed(self, recipes):
+        recipe_ingredients_changed.send(sender=Recipe, recipes=recipes)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.ingredients_changed([obj.recipe_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.ingredients_changed([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipes = list(queryset.values_list('recipe', flat=True))
+        super().delete_queryset(request, queryset)
+        self.ingredients_changed(recipes)
+
 
 @admin.register(FavoriteRecipe)
 class FavoriteRecipeAdmin(admin.ModelAdmin):
@@ -41,3 +60,15 @@ class FavoriteRecipeAdmin(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'total_amount')
+    list_filter = ('user',)
+
+
+@admin.register(StoredImage)
+class StoredImageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'ref_count', 'updated')
+    search_fields = ('name',)
@@ -0,0 +1,89 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+from recipes.versions import get_versions
+
+
+class IngredientIndex:
+    '''Каталог ингредиентов в памяти процесса для поиска по началу названия.
+
+    Названия хранятся в отсортированном списке, поиск выполняется
+    бинарным поиском без запросов к БД. Каталог перечитывается, если
+    изменилась версия ресурса 'ingredients' (она общая для всех
+    процессов, см. recipes.versions) или истек INGREDIENTS_INDEX_TIMEOUT.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = ([], [])
+        self._version = None
+        self._loaded_at = None
+
+    def _is_stale(self, version):
+        return (
+            self._loaded_at is None
+            or self._version < version
+            or time.monotonic() - self._loaded_at
+            > settings.INGREDIENTS_INDEX_TIMEOUT
+        )
+
+    def _load(self, version):
+        rows = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator()
+        )
+        self._index = (
+            [row[0] for row in rows],
+            [row[1:] for row in rows],
+        )
+        self._version = version
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self, version):
+        if version is None:
+            version, = get_versions(('ingredients',))
+        if self._is_stale(version):
+            with self._lock:
+                if self._is_stale(version):
+                    self._load(version)
+
+    def search(self, prefix, limit, version=None):
+        '''Ингредиенты, названия которых начинаются с prefix.
+
+        version — уже известная запросу версия 'ingredients', с ней
+        ответ согласован с ETag и не требует запроса к БД.
+        '''
+        self._ensure_loaded(version)
+        keys, items = self._index
+        prefix = prefix.strip().lower()
+        result = []
+        index = bisect_left(keys, prefix)
+        while (
+            index < len(keys)
+            and len(result) < limit
+            and keys[index].startswith(prefix)
+        ):
+            pk, name, measurement_unit = items[index]
+            result.append({
+                'id': pk,
+                'name': name,
+                'measurement_unit': measurement_unit,
+            })
+            index += 1
+        return result
+
+    def invalidate(self):
+        '''Перечитать каталог при следующем поиске в этом процессе.
+
+        Другие процессы узнают об изменении по версии 'ingredients',
+        ее повышает bump_version('ingredients').
+        '''
+        self._loaded_at = None
+
+
+ingredient_index = IngredientIndex()
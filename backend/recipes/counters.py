@@ -0,0 +1,65 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# Счетчики, которые хранятся в строках рецептов и пользователей:
+# (модель-связь, поле связи, модель со счетчиком, поле счетчика).
+COUNTERS = (
+    (FavoriteRecipe, 'recipe', Recipe, 'favorites_count'),
+    (ShoppingCart, 'recipe', Recipe, 'in_carts_count'),
+    (Follow, 'author', User, 'followers_count'),
+    (Recipe, 'author', User, 'recipes_count'),
+)
+
+
+def change_counters(sender, instance, delta):
+    '''Меняет счетчики, связанные с созданной или удаленной строкой.
+
+    Обновление выполняется через F() в текущей транзакции, поэтому
+    параллельные запросы не теряют изменения.
+    '''
+    for link, field, model, counter in COUNTERS:
+        if link is sender:
+            update_counter(
+                model, counter, [getattr(instance, f'{field}_id')], delta
+            )
+
+
+def change_link_counters(sender, target_ids, delta):
+    '''То же для пакета связей пользователя с объектами target_ids.'''
+    for link, field, model, counter in COUNTERS:
+        if link is sender:
+            update_counter(model, counter, target_ids, delta)
+
+
+def update_counter(model, counter, pks, delta):
+    model.objects.filter(pk__in=pks).update(
+        **{counter: Greatest(F(counter) + delta, 0)}
+    )
+
+
+def actual_count(link, field):
+    return Coalesce(Subquery(
+        link.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def reconcile(dry_run=False):
+    '''Сверяет счетчики с исходными таблицами и исправляет расхождения.
+
+    Возвращает число расхождений по каждому счетчику.
+    '''
+    drift = {}
+    for link, field, model, counter in COUNTERS:
+        stale = model.objects.annotate(
+            actual=actual_count(link, field)
+        ).exclude(**{counter: F('actual')})
+        drift[f'{model._meta.model_name}.{counter}'] = count = stale.count()
+        if count and not dry_run:
+            model.objects.filter(pk__in=stale.values('pk')).update(
+                **{counter: actual_count(link, field)}
+            )
+    return drift
@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/renditions/'
+FORMAT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_RENDITION_WORKERS,
+                    thread_name_prefix='image-renditions'
+                )
+    return _executor
+
+
+def rendition_name(name, rendition, image_format):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return (
+        f'{RENDITIONS_DIR}{stem}_{rendition}.'
+        f'{FORMAT_EXTENSIONS[image_format]}'
+    )
+
+
+def make_renditions(name, overwrite=False):
+    '''Сохраняет уменьшенные копии картинки во всех форматах.
+
+    Имена копий получаются из имени картинки, поэтому уже созданные
+    копии той же картинки используются повторно, если не задан overwrite.
+
+    Возвращает словарь вида {'source': имя исходной картинки,
+    'thumbnail': {'webp': имя файла, 'jpg': имя файла}, ...}.
+    '''
+    names = {
+        rendition: {
+            FORMAT_EXTENSIONS[image_format]:
+                rendition_name(name, rendition, image_format)
+            for image_format in settings.IMAGE_RENDITION_FORMATS
+        }
+        for rendition in settings.IMAGE_RENDITIONS
+    }
+    if not overwrite and all(
+        default_storage.exists(path)
+        for paths in names.values() for path in paths.values()
+    ):
+        return {'source': name, **names}
+    with Recipe.image.field.storage.open(name) as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+    renditions = {'source': name}
+    for rendition, size in settings.IMAGE_RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        renditions[rendition] = {}
+        for image_format in settings.IMAGE_RENDITION_FORMATS:
+            converted = image
+            if image_format == 'JPEG' and image.mode == 'RGBA':
+                converted = Image.new('RGB', image.size, 'white')
+                converted.paste(image, mask=image.getchannel('A'))
+            buffer = BytesIO()
+            converted.save(
+                buffer, image_format,
+                quality=settings.IMAGE_RENDITION_QUALITY
+            )
+            path = rendition_name(name, rendition, image_format)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            renditions[rendition][FORMAT_EXTENSIONS[image_format]] = (
+                default_storage.save(path, ContentFile(buffer.getvalue()))
+            )
+    return renditions
+
+
+def process_recipe_image(recipe_id, name, overwrite=False):
+    '''Создает копии картинки рецепта и сохраняет их имена в рецепте.
+
+    Если картинку рецепта успели заменить, результат отбрасывается.
+    '''
+    try:
+        renditions = make_renditions(name, overwrite)
+        recipe = Recipe.objects.filter(pk=recipe_id, image=name).first()
+        if recipe is not None:
+            recipe.image_renditions = renditions
+            recipe.save(update_fields=('image_renditions',))
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', name)
+
+
+def _process_in_worker(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    finally:
+        # У каждого потока свое соединение с БД.
+        connections.close_all()
+
+
+def schedule_renditions(recipe):
+    '''Ставит обработку картинки рецепта в очередь фоновых потоков.'''
+    return get_executor().submit(
+        _process_in_worker, recipe.pk, recipe.image.name
+    )
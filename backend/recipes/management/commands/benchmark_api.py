@@ -0,0 +1,195 @@
+import json
+import platform
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.cache import response_cache
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = (len(values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Замер времени ответа и числа SQL-запросов для основных '
+        'эндпоинтов API. Результат сохраняется в JSON и может '
+        'сравниваться с предыдущим'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=30,
+            help='Количество запросов к каждому эндпоинту'
+        )
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='Файл для результатов'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Файл с предыдущими результатами для сравнения'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p50 относительно baseline (доля)'
+        )
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя, от которого выполняются запросы'
+        )
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            # Пользователь с наибольшим числом подписок.
+            user = User.objects.annotate(
+                follows=Count('follower')
+            ).order_by('-follows', 'pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, сначала запустите generate_data'
+            )
+        return user
+
+    def get_endpoints(self, user):
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        recipe = Recipe.objects.order_by('pk').first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        pages = Recipe.objects.count() // settings.REST_FRAMEWORK[
+            'PAGE_SIZE'] or 1
+        endpoints = {
+            'recipes': '/api/recipes/',
+            'recipes_deep_page': f'/api/recipes/?page={pages}',
+            'recipes_cursor': '/api/recipes/?cursor=',
+            'recipes_popular': '/api/recipes/?ordering=popular',
+            'recipes_tags': '/api/recipes/?' + '&'.join(
+                f'tags={slug}' for slug in tags),
+            'recipes_favorited': '/api/recipes/?is_favorited=1',
+            'recipes_in_cart': '/api/recipes/?is_in_shopping_cart=1',
+            'recipes_author': f'/api/recipes/?author={user.pk}',
+            'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+            'download_shopping_cart': '/api/recipes/download_shopping_cart/',
+            'tags': '/api/tags/',
+        }
+        if recipe is not None:
+            endpoints['recipe_detail'] = f'/api/recipes/{recipe.pk}/'
+        if ingredient is not None:
+            endpoints['ingredients_search'] = (
+                f'/api/ingredients/?name={ingredient.name[:3]}'
+            )
+        return endpoints
+
+    def measure(self, client, url, repeat):
+        latencies = []
+        for _ in range(repeat):
+            response_cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{url}: ответ {response.status_code}'
+                )
+        return {
+            'url': url,
+            'status': response.status_code,
+            'queries': len(context.captured_queries),
+            **{
+                f'p{percent}_ms': round(percentile(latencies, percent), 3)
+                for percent in PERCENTILES
+            },
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'max_ms': round(max(latencies), 3),
+        }
+
+    def compare(self, results, baseline_path, tolerance):
+        try:
+            with open(baseline_path, encoding='utf-8') as file:
+                baseline = json.load(file)['endpoints']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать baseline: {error}')
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if result['queries'] > previous['queries']:
+                regressions.append(
+                    f'{name}: запросов {previous["queries"]} -> '
+                    f'{result["queries"]}'
+                )
+            if result['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p50 {previous["p50_ms"]} -> '
+                    f'{result["p50_ms"]} мс'
+                )
+        return regressions
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        results = {}
+        for name, url in self.get_endpoints(user).items():
+            # Первый запрос прогревает кэши процесса и не учитывается.
+            client.get(url)
+            results[name] = self.measure(client, url, options['repeat'])
+            self.stdout.write(
+                '{name}: p50 {p50_ms} мс, p90 {p90_ms} мс, '
+                'p99 {p99_ms} мс, запросов {queries}'.format(
+                    name=name, **results[name]
+                )
+            )
+
+        report = {
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'user': user.username,
+            'counts': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'repeat': options['repeat'],
+            'endpoints': results,
+        }
+        regressions = []
+        if options['baseline']:
+            regressions = self.compare(
+                results, options['baseline'], options['tolerance']
+            )
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты сохранены в {options["output"]}')
+        if regressions:
+            raise CommandError(
+                'Найдены регрессии:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,190 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote, urlsplit
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.management.commands.benchmark_api import percentile
+
+PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?cursor=',
+    '/api/tags/',
+    '/api/ingredients/?name=' + quote('са'),
+    '/api/users/subscriptions/',
+)
+
+
+class SlowClient(threading.Thread):
+    '''Клиент, который медленно отправляет тело POST-запроса.
+
+    Так ведет себя загрузка картинки по плохому каналу: синхронный
+    воркер занят ею целиком, ASGI-сервер читает тело асинхронно.
+    '''
+
+    def __init__(self, base_url, stop):
+        super().__init__(daemon=True)
+        self.url = urlsplit(base_url)
+        self.stop = stop
+
+    def run(self):
+        try:
+            with socket.create_connection(
+                (self.url.hostname, self.url.port or 80), timeout=5
+            ) as connection:
+                connection.sendall((
+                    'POST /api/auth/token/login/ HTTP/1.1\r\n'
+                    f'Host: {self.url.netloc}\r\n'
+                    'Content-Type: application/json\r\n'
+                    'Content-Length: 1000000\r\n\r\n'
+                ).encode())
+                while not self.stop.wait(0.5):
+                    connection.sendall(b' ')
+        except OSError:
+            pass
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Пропускная способность запущенного сервера при параллельных '
+        'запросах и число открытых им подключений к БД. Запускается '
+        'для каждого варианта настроек (SERVER_MODE, DB_CONN_MAX_AGE), '
+        'результаты сравниваются через --baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000',
+            help='Адрес сервера'
+        )
+        parser.add_argument(
+            '--concurrency', default='1,10,50',
+            help='Уровни параллельности через запятую'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Запросов на каждый уровень параллельности'
+        )
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Число клиентов, медленно загружающих тело запроса'
+        )
+        parser.add_argument('--token', help='Токен для авторизации')
+        parser.add_argument(
+            '--label', default='server',
+            help='Название прогона, например wsgi или asgi'
+        )
+        parser.add_argument('--output', default='concurrency.json')
+        parser.add_argument(
+            '--baseline',
+            help='Файл результатов другого прогона для сравнения'
+        )
+
+    def fetch(self, path):
+        request = Request(self.base_url + path, headers=self.headers)
+        start = time.perf_counter()
+        try:
+            with urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status < 400
+        except (HTTPError, URLError, OSError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    def connections_opened(self):
+        '''Число открытых сервером подключений к БД из /metrics.'''
+        try:
+            with urlopen(self.base_url + '/metrics', timeout=5) as response:
+                lines = response.read().decode().splitlines()
+        except (HTTPError, URLError, OSError):
+            return None
+        return sum(
+            float(line.rsplit(' ', 1)[1]) for line in lines
+            if line.startswith('db_connections_total')
+        )
+
+    def run_level(self, concurrency, count):
+        paths = [PATHS[number % len(PATHS)] for number in range(count)]
+        opened = self.connections_opened()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(self.fetch, paths))
+        elapsed = time.perf_counter() - start
+        latencies = [duration * 1000 for duration, ok in results if ok]
+        if not latencies:
+            raise CommandError(f'Сервер {self.base_url} не отвечает')
+        # Снимки воркеров обновляются раз в FLUSH_INTERVAL.
+        time.sleep(settings.METRICS['FLUSH_INTERVAL'] * 2)
+        closed = self.connections_opened()
+        connections = (
+            None if opened is None or closed is None
+            else int(closed - opened)
+        )
+        return {
+            'requests': count,
+            'errors': sum(not ok for _, ok in results),
+            'db_connections': connections,
+            'throughput_rps': round(count / elapsed, 1),
+            **{
+                f'p{percent}_ms': round(percentile(latencies, percent), 3)
+                for percent in (50, 99)
+            },
+        }
+
+    def handle(self, *args, **options):
+        self.base_url = options['base_url'].rstrip('/')
+        self.headers = {'Accept': 'application/json'}
+        if options['token']:
+            self.headers['Authorization'] = f'Token {options["token"]}'
+
+        stop = threading.Event()
+        for _ in range(options['slow_clients']):
+            SlowClient(self.base_url, stop).start()
+        results = {}
+        try:
+            for level in options['concurrency'].split(','):
+                results[level] = self.run_level(
+                    int(level), options['requests']
+                )
+                self.stdout.write(
+                    '{level}: {throughput_rps} запросов/с, p50 {p50_ms} мс, '
+                    'p99 {p99_ms} мс, ошибок {errors}, '
+                    'новых подключений к БД {db_connections}'.format(
+                        level=level, **results[level]
+                    )
+                )
+        finally:
+            stop.set()
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump({
+                'label': options['label'],
+                'slow_clients': options['slow_clients'],
+                'levels': results,
+            }, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты сохранены в {options["output"]}')
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+
+    def compare(self, results, baseline_path):
+        try:
+            with open(baseline_path, encoding='utf-8') as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать baseline: {error}')
+        for level, result in results.items():
+            previous = baseline['levels'].get(level)
+            if previous is None:
+                continue
+            self.stdout.write(
+                f'{level}: {baseline["label"]} '
+                f'{previous["throughput_rps"]} -> '
+                f'{result["throughput_rps"]} запросов/с'
+            )
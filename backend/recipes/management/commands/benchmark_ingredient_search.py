@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.autocomplete import ingredient_index
+from recipes.models import Ingredient
+from recipes.versions import get_versions
+
+
+class Command(BaseCommand):
+
+    help = 'Сравнение поиска ингредиентов в памяти и через БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'prefixes', nargs='*', default=['а', 'мо', 'сыр', 'пшен'],
+            help='Начала названий для поиска'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='Количество повторов каждого запроса'
+        )
+
+    def measure(self, search, prefixes, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for prefix in prefixes:
+                search(prefix)
+        return (time.perf_counter() - start) / (repeat * len(prefixes))
+
+    def handle(self, *args, **options):
+        prefixes, repeat = options['prefixes'], options['repeat']
+        limit = settings.INGREDIENTS_SEARCH_LIMIT
+        ingredient_index.invalidate()
+        # Версию API получает вместе с ETag, поиск ее не запрашивает.
+        version, = get_versions(('ingredients',))
+
+        start = time.perf_counter()
+        ingredient_index.search('', 1, version)
+        load_time = time.perf_counter() - start
+
+        database = self.measure(
+            lambda prefix: list(Ingredient.objects.filter(
+                name__istartswith=prefix
+            ).values('id', 'name', 'measurement_unit')),
+            prefixes, repeat
+        )
+        memory = self.measure(
+            lambda prefix: ingredient_index.search(prefix, limit, version),
+            prefixes, repeat
+        )
+        self.stdout.write(
+            f'Загрузка индекса: {load_time * 1000:.2f} мс\n'
+            f'БД (istartswith): {database * 1000:.3f} мс на запрос\n'
+            f'Индекс в памяти: {memory * 1000:.3f} мс на запрос\n'
+            f'Ускорение: {database / memory:.1f}x'
+        )
@@ -0,0 +1,103 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+
+from api.filters import RecipeFilter
+from recipes.models import FavoriteRecipe, Recipe
+from users.models import User
+
+BENCHMARK_USERNAME = 'benchmark_recipe_filters'
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Сравнение фильтра is_favorited через EXISTS со списком id. '
+        'Тестовые данные создаются в транзакции и откатываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--favorites', type=int, default=10000,
+            help='Количество избранных рецептов у пользователя'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Количество повторов каждого запроса'
+        )
+        parser.add_argument(
+            '--page-size', type=int, default=6,
+            help='Размер страницы выдачи'
+        )
+
+    def create_data(self, favorites):
+        user = User.objects.create_user(
+            username=BENCHMARK_USERNAME,
+            email=f'{BENCHMARK_USERNAME}@example.com',
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=user, name=f'Рецепт {number}', image='',
+                text='Описание', cooking_time=1
+            )
+            for number in range(favorites + favorites // 10)
+        )
+        FavoriteRecipe.objects.bulk_create(
+            FavoriteRecipe(user=user, recipe_id=pk)
+            for pk in Recipe.objects.filter(author=user).values_list(
+                'pk', flat=True)[:favorites]
+        )
+        return user
+
+    def legacy_filter(self, user, value):
+        # Прежняя реализация: список id избранного в условии IN.
+        objects = user.favoriterecipe.all()
+        return Recipe.objects.filter(
+            pk__in=[item.recipe.pk for item in objects]
+        )
+
+    def exists_filter(self, user, value):
+        request = RequestFactory().get('/', {'is_favorited': value})
+        request.user = user
+        return RecipeFilter(
+            request.GET, Recipe.objects.all(), request=request
+        ).qs
+
+    def measure(self, make_queryset, user, value, repeat, page_size):
+        # Журнал connection.queries ограничен 9000 записей, поэтому
+        # запросы считаются обработчиком execute_wrapper.
+        sql_sizes = []
+
+        def count_query(execute, sql, params, many, context):
+            sql_sizes.append(len(sql) + len(params or ()))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                queryset = make_queryset(user, value).order_by('-pub_date')
+                queryset.count()
+                list(queryset[:page_size])
+            elapsed = (time.perf_counter() - start) / repeat
+        return elapsed, len(sql_sizes) // repeat, max(sql_sizes)
+
+    def handle(self, *args, **options):
+        repeat, page_size = options['repeat'], options['page_size']
+        with transaction.atomic():
+            user = self.create_data(options['favorites'])
+            for label, make_queryset, value in (
+                ('IN (список id), is_favorited=1', self.legacy_filter, 1),
+                ('EXISTS, is_favorited=1', self.exists_filter, 1),
+                ('EXISTS, is_favorited=0', self.exists_filter, 0),
+            ):
+                elapsed, queries, sql_size = self.measure(
+                    make_queryset, user, value, repeat, page_size
+                )
+                self.stdout.write(
+                    f'{label}: {elapsed * 1000:.2f} мс, '
+                    f'запросов: {queries}, '
+                    f'размер запроса: {sql_size} (символов SQL и параметров)'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,99 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.images import rendition_name
+from recipes.models import Recipe, StoredImage
+
+IMAGES_DIR = 'recipes/images'
+
+
+class Command(BaseCommand):
+
+    help = 'Удаление файлов картинок, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=60,
+            help=(
+                'Не трогать файлы, измененные за последние N минут: они '
+                'могут принадлежать незавершенным загрузкам'
+            )
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено'
+        )
+
+    def delete_file(self, name, dry_run):
+        storage = Recipe.image.field.storage
+        names = [name] + [
+            rendition_name(name, rendition, image_format)
+            for rendition in settings.IMAGE_RENDITIONS
+            for image_format in settings.IMAGE_RENDITION_FORMATS
+        ]
+        for path in names:
+            file_storage = storage if path == name else default_storage
+            if file_storage.exists(path):
+                self.stdout.write(f'Удаление {path}')
+                if not dry_run:
+                    file_storage.delete(path)
+
+    def walk(self, storage, path):
+        directories, files = storage.listdir(path)
+        for file in files:
+            yield f'{path}/{file}'
+        for directory in directories:
+            yield from self.walk(storage, f'{path}/{directory}')
+
+    def collect_stored(self, deadline, dry_run):
+        count = 0
+        candidates = StoredImage.objects.filter(
+            ref_count__lte=0, updated__lt=deadline
+        ).values_list('pk', flat=True)
+        for pk in list(candidates):
+            with transaction.atomic():
+                image = StoredImage.objects.select_for_update().filter(
+                    pk=pk, ref_count__lte=0, updated__lt=deadline
+                ).first()
+                if image is None or Recipe.objects.filter(
+                        image=image.name).exists():
+                    continue
+                self.delete_file(image.name, dry_run)
+                if not dry_run:
+                    image.delete()
+                count += 1
+        return count
+
+    def collect_untracked(self, deadline, dry_run):
+        # Файлы, загруженные до появления учета ссылок, и файлы
+        # незавершенных загрузок.
+        storage = Recipe.image.field.storage
+        if not os.path.isdir(storage.path(IMAGES_DIR)):
+            return 0
+        known = set(StoredImage.objects.values_list('name', flat=True))
+        known |= set(Recipe.objects.values_list('image', flat=True))
+        count = 0
+        for name in self.walk(storage, IMAGES_DIR):
+            if name in known or storage.get_modified_time(name) >= deadline:
+                continue
+            self.delete_file(name, dry_run)
+            count += 1
+        return count
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(minutes=options['grace'])
+        dry_run = options['dry_run']
+        count = (
+            self.collect_stored(deadline, dry_run)
+            + self.collect_untracked(deadline, dry_run)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено картинок: {count}'
+        ))
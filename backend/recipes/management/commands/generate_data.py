@@ -0,0 +1,193 @@
+import random
+from io import BytesIO
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.cache import response_cache
+from recipes.autocomplete import ingredient_index
+from recipes.models import (
+    FavoriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, StoredImage, Tag
+)
+from recipes.versions import bump_version
+from users.models import Follow, User
+
+PASSWORD = 'synthetic-password'
+
+
+def batched(objects, size):
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Генерация синтетических данных: пользователи, подписки, рецепты, '
+        'избранное и корзины'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--recipes', type=int, default=10,
+            help='Рецептов на пользователя'
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Подписок на пользователя'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=50,
+            help='Избранных рецептов на пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=10,
+            help='Рецептов в корзине на пользователя'
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=8,
+            help='Ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--tags', type=int, default=2,
+            help='Тегов у рецепта'
+        )
+        parser.add_argument(
+            '--prefix', default='synthetic',
+            help='Префикс имен создаваемых пользователей'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def bulk_create(self, model, objects):
+        count = 0
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+
+    def sample(self, population, size):
+        return self.random.sample(population, min(size, len(population)))
+
+    def ensure_catalog(self, tags_count):
+        if not Ingredient.objects.exists():
+            self.bulk_create(Ingredient, (
+                Ingredient(
+                    name=f'Ингредиент {number}', measurement_unit='г'
+                )
+                for number in range(1000)
+            ))
+        for number in range(Tag.objects.count(), max(tags_count, 3)):
+            Tag.objects.create(
+                name=f'Тег {number}',
+                color=f'#{number:06X}',
+                slug=f'tag-{number}'
+            )
+
+    def make_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'JPEG')
+        field = Recipe._meta.get_field('image')
+        return field.storage.save(
+            field.generate_filename(None, 'synthetic.jpg'),
+            ContentFile(buffer.getvalue())
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'укажите другой --prefix'
+            )
+
+        with transaction.atomic():
+            self.generate(prefix, options)
+        # bulk_create не отправляет сигналы, обновляющие счетчики.
+        call_command('reconcile_counters', stdout=self.stdout)
+        ingredient_index.invalidate()
+        bump_version('tags', 'ingredients')
+        response_cache.clear()
+        self.stdout.write(self.style.SUCCESS('Данные созданы'))
+
+    def generate(self, prefix, options):
+        self.ensure_catalog(options['tags'])
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+
+        password = make_password(PASSWORD)
+        self.bulk_create(User, (
+            User(
+                username=f'{prefix}_{number}',
+                email=f'{prefix}_{number}@example.com',
+                first_name='Имя', last_name='Фамилия',
+                password=password
+            )
+            for number in range(options['users'])
+        ))
+        users = User.objects.filter(username__startswith=f'{prefix}_')
+        user_ids = list(users.values_list('pk', flat=True))
+
+        self.bulk_create(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in self.sample(user_ids, options['follows'])
+            if author_id != user_id
+        ))
+
+        image = self.make_image()
+        self.bulk_create(Recipe, (
+            Recipe(
+                author_id=user_id,
+                name=f'Рецепт {user_id}-{number}',
+                image=image,
+                text='Описание рецепта. ' * 20,
+                cooking_time=self.random.randint(5, 180)
+            )
+            for user_id in user_ids
+            for number in range(options['recipes'])
+        ))
+        recipe_ids = list(Recipe.objects.filter(
+            author__in=users
+        ).values_list('pk', flat=True))
+        StoredImage.objects.acquire(image, len(recipe_ids))
+
+        self.bulk_create(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.sample(tag_ids, options['tags'])
+        ))
+        self.bulk_create(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.sample(
+                ingredient_ids, options['ingredients'])
+        ))
+        self.bulk_create(FavoriteRecipe, (
+            FavoriteRecipe(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in self.sample(recipe_ids, options['favorites'])
+        ))
+        self.bulk_create(ShoppingCart, (
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in self.sample(recipe_ids, options['cart'])
+        ))
+        ShoppingListItem.objects.refresh(users=users.values('pk'))
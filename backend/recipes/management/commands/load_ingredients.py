@@ -1,31 +1,207 @@
 import csv
-
+import io
+import json
+from itertools import islice
 from pathlib import Path
-from foodgram_backend.settings import BASE_DIR
-from django.core.management.base import BaseCommand
 
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from foodgram_backend.settings import BASE_DIR
+from recipes.autocomplete import ingredient_index
 from recipes.models import Ingredient
+from recipes.versions import bump_version
+
+DEFAULT_PATH = Path(BASE_DIR) / 'data' / 'ingredients.csv'
+MAX_LENGTH = 200
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        yield row[:2] if len(row) >= 2 else None
+
+
+def read_json(file):
+    '''Читает JSON-массив объектов по частям, не загружая его целиком.'''
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+    started = finished = False
+    while not finished:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('JSON должен быть массивом объектов')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                finished = True
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON')
+                break
+            yield (
+                [item.get('name'), item.get('measurement_unit')]
+                if isinstance(item, dict) else None
+            )
+        if not chunk:
+            break
+
 
+READERS = {'csv': read_csv, 'json': read_json}
 
-class DataIsLoaded(Exception):
-    """Данные уже были загружены в БД"""
-    pass
+
+class RowStream(io.TextIOBase):
+    '''Файлоподобный поток CSV-строк для COPY ... FROM STDIN.'''
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+        self.count = 0
+        self.writer = csv.writer(self, lineterminator='\n')
+        self.pending = []
+
+    def write(self, value):
+        self.pending.append(value)
+        return len(value)
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.count += 1
+            self.buffer += ''.join(self.pending)
+            self.pending.clear()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
 
 
 class Command(BaseCommand):
 
-    help = 'Загрузка списка ингредиентов в БД'
+    help = (
+        'Загрузка и обновление списка ингредиентов из CSV или JSON. '
+        'Уже существующие ингредиенты пропускаются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*', default=[str(DEFAULT_PATH)],
+            help='Файлы с ингредиентами (.csv или .json)'
+        )
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файлов, если его нельзя понять по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пакета вставки'
+        )
+
+    def clean_rows(self, rows):
+        for row in rows:
+            if row is None or not all(isinstance(value, str) for value in row):
+                self.counts['invalid'] += 1
+                continue
+            name, measurement_unit = (value.strip() for value in row)
+            if (
+                not name or not measurement_unit
+                or len(name) > MAX_LENGTH
+                or len(measurement_unit) > MAX_LENGTH
+            ):
+                self.counts['invalid'] += 1
+                continue
+            yield name, measurement_unit
+
+    def load_batches(self, rows, batch_size):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                return
+            batch = dict.fromkeys(chunk)
+            names = {name for name, _ in batch}
+            existing = set(Ingredient.objects.filter(
+                name__in=names
+            ).values_list('name', 'measurement_unit'))
+            new = [row for row in batch if row not in existing]
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in new
+                ),
+                ignore_conflicts=True
+            )
+            self.counts['inserted'] += len(new)
+            self.counts['skipped'] += len(chunk) - len(new)
+
+    def load_copy(self, rows):
+        # COPY во временную таблицу и одна вставка с ON CONFLICT.
+        table = Ingredient._meta.db_table
+        stream = RowStream(rows)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                stream
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            self.counts['inserted'] += cursor.rowcount
+            self.counts['skipped'] += stream.count - cursor.rowcount
+
+    def read(self, path, file_format):
+        path = Path(path)
+        file_format = file_format or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла {path}, укажите --format'
+            )
+        try:
+            with open(path, encoding='utf-8') as file:
+                yield from READERS[file_format](file)
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
 
     def handle(self, *args, **options):
-        file_path = Path(BASE_DIR) / 'data' / 'ingredients.csv'
-        if Ingredient.objects.exists():
-            raise DataIsLoaded('Данные уже загружены')
-        with open(file_path, encoding='utf-8') as csv_file:
-            ingredients = [
-                Ingredient(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
-                for row in csv.reader(csv_file)
-            ]
-            Ingredient.objects.bulk_create(ingredients)
+        self.counts = {'inserted': 0, 'skipped': 0, 'invalid': 0}
+        for path in options['paths']:
+            rows = self.clean_rows(self.read(path, options['format']))
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    self.load_copy(rows)
+                else:
+                    self.load_batches(rows, options['batch_size'])
+        if self.counts['inserted']:
+            ingredient_index.invalidate()
+            bump_version('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            'Добавлено: {inserted}, уже были: {skipped}, '
+            'некорректных строк: {invalid}'.format(**self.counts)
+        ))
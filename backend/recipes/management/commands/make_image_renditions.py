@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+
+    help = 'Создание уменьшенных копий картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        count = 0
+        recipes = Recipe.objects.exclude(image='').values_list(
+            'pk', 'image', 'image_renditions')
+        for pk, image, renditions in recipes.iterator():
+            if options['all'] or renditions.get('source') != image:
+                process_recipe_image(pk, image, options['all'])
+                count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {count}'
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+
+    help = 'Пересборка или проверка списков покупок по корзинам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить списки покупок с корзинами'
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            ShoppingListItem.objects.refresh()
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок пересобраны'
+            ))
+            return
+
+        expected = {
+            (row['recipe__shoppingcart__user'], row['ingredient']):
+                row['total_amount']
+            for row in ShoppingListItem.objects.totals()
+        }
+        actual = {
+            (row['user'], row['ingredient']): row['total_amount']
+            for row in ShoppingListItem.objects.values(
+                'user', 'ingredient', 'total_amount')
+        }
+        mismatches = {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        }
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в списках покупок: {len(mismatches)}. '
+                'Запустите команду без --verify для пересборки'
+            )
+        self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import response_cache
+from recipes.counters import reconcile
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Сверка счетчиков избранного, корзин, подписчиков и рецептов '
+        'с исходными таблицами и исправление расхождений'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только найти расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = reconcile(dry_run=options['verify'])
+        for counter, count in drift.items():
+            self.stdout.write(f'{counter}: расхождений {count}')
+        if not any(drift.values()):
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
+        elif options['verify']:
+            raise CommandError(
+                'Найдены расхождения. Запустите команду без --verify '
+                'для исправления'
+            )
+        else:
+            response_cache.clear()
+            self.stdout.write(self.style.SUCCESS('Счетчики исправлены'))
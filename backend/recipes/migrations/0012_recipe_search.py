@@ -0,0 +1,59 @@
+# Generated by Django 3.2.3 on 2026-10-18 17:57
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+FORWARD_SQL = (
+    'CREATE INDEX recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (name gin_trgm_ops)',
+    'CREATE INDEX recipes_ingredient_name_upper_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+    'CREATE INDEX recipes_recipe_name_upper_trgm '
+    'ON recipes_recipe USING gin (UPPER(name::text) gin_trgm_ops)',
+    'CREATE INDEX recipes_recipe_search_vector '
+    'ON recipes_recipe USING gin (search_vector)',
+    'CREATE TRIGGER recipes_recipe_search_vector_update '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger('
+    "search_vector, 'pg_catalog.russian', name, text)",
+    "UPDATE recipes_recipe SET search_vector = to_tsvector("
+    "'pg_catalog.russian', coalesce(name, '') || ' ' || coalesce(text, ''))",
+)
+
+BACKWARD_SQL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_update '
+    'ON recipes_recipe',
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector',
+    'DROP INDEX IF EXISTS recipes_recipe_name_upper_trgm',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_trgm',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_trgm',
+)
+
+
+def run_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_auto_20261018_2055'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_postgresql(FORWARD_SQL), run_postgresql(BACKWARD_SQL)
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_search'),
+    ]
+
+    operations = [
+        # Индекс (recipe_id, tag_id) уже создан ограничением уникальности
+        # промежуточной таблицы; обратный порядок нужен для выборки
+        # рецептов по тегу.
+        migrations.RunSQL(
+            'CREATE INDEX recipes_recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipes_recipe_tags_tag_recipe_idx',
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:11
+
+from django.db import migrations, models
+import django.utils.timezone
+import recipes.storage
+
+
+def count_image_references(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    StoredImage = apps.get_model('recipes', 'StoredImage')
+    counts = Recipe.objects.exclude(image='').values('image').annotate(
+        ref_count=models.Count('id')
+    ).order_by()
+    StoredImage.objects.bulk_create(
+        StoredImage(name=row['image'], ref_count=row['ref_count'])
+        for row in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Файл')),
+                ('ref_count', models.IntegerField(default=0, verbose_name='Число ссылок')),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Изменен')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/images/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(
+            count_image_references, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:13
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    '''Оставляет по одному ингредиенту на пару (название, единица).
+
+    Ссылки рецептов и списков покупок переносятся на оставшийся
+    ингредиент; если он уже есть в том же рецепте или списке,
+    количества складываются.
+    '''
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep=models.Min('id'), count=models.Count('id'))
+        .filter(count__gt=1).order_by()
+    )
+    for group in duplicates:
+        removed = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keep']).values_list('id', flat=True))
+        for model, owner, amount in (
+            (RecipeIngredient, 'recipe_id', 'amount'),
+            (ShoppingListItem, 'user_id', 'total_amount'),
+        ):
+            rows = model.objects.filter(
+                ingredient_id__in=[group['keep'], *removed]
+            ).order_by('ingredient_id', 'id')
+            kept = {}
+            for row in rows:
+                target = kept.get(getattr(row, owner))
+                if target is None:
+                    if row.ingredient_id != group['keep']:
+                        row.ingredient_id = group['keep']
+                        row.save(update_fields=('ingredient',))
+                    kept[getattr(row, owner)] = row
+                else:
+                    setattr(target, amount,
+                            getattr(target, amount) + getattr(row, amount))
+                    target.save(update_fields=(amount,))
+                    row.delete()
+        Ingredient.objects.filter(id__in=removed).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_stored_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_measurement_unit'),
+        ),
+    ]
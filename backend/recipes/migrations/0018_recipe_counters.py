@@ -0,0 +1,51 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:24
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    counters = (
+        ('FavoriteRecipe', 'recipe', Recipe, 'favorites_count'),
+        ('ShoppingCart', 'recipe', Recipe, 'in_carts_count'),
+        ('Follow', 'author', User, 'followers_count'),
+        ('Recipe', 'author', User, 'recipes_count'),
+    )
+    for link_name, field, model, counter in counters:
+        app = 'users' if link_name == 'Follow' else 'recipes'
+        link = apps.get_model(app, link_name)
+        model.objects.update(**{counter: Coalesce(
+            models.Subquery(
+                link.objects.filter(**{field: models.OuterRef('pk')})
+                .order_by().values(field)
+                .annotate(count=models.Count('pk')).values('count')
+            ), 0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_ingredient_unique_name_measurement_unit'),
+        ('users', '0007_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,36 @@
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVectorField, TrigramSimilarity
+)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (
+    Exists, F, OuterRef, Prefetch, Q, Subquery, Sum, Value
+)
+from django.utils import timezone
 
+from recipes.storage import ContentAddressedStorage
 from recipes.validators import validate_cooking_time
-from users.models import User
+from users.models import CounterFieldsMixin, LinkQuerySet, User
+
+
+SEARCH_CONFIG = 'russian'
+
+
+class IngredientQuerySet(models.QuerySet):
+
+    def search(self, query):
+        '''Поиск по подстроке и похожим названиям, лучшие совпадения первыми.
+
+        В PostgreSQL используются индексы pg_trgm, в остальных БД —
+        обычный поиск по подстроке.
+        '''
+        if connections[self.db].vendor != 'postgresql':
+            return self.filter(name__icontains=query).order_by('name')
+        return self.filter(
+            Q(name__icontains=query) | Q(name__trigram_similar=query)
+        ).annotate(
+            similarity=TrigramSimilarity('name', query)
+        ).order_by('-similarity', 'name')
 
 
 class Ingredient(models.Model):
@@ -16,10 +44,18 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения'
     )
 
+    objects = IngredientQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('id',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_measurement_unit'
+            )
+        ]
 
     def get_ingredient(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -42,7 +78,70 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        '''Флаги is_favorited и is_in_shopping_cart одним запросом.'''
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    def with_related(self, user):
+        '''Теги, ингредиенты и авторы без отдельного запроса на рецепт.'''
+        return self.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user)
+            ),
+        )
+
+    def for_list(self, user):
+        return self.with_user_flags(user).with_related(user).defer(
+            'search_vector'
+        )
+
+    def search(self, query):
+        '''Полнотекстовый поиск по названию и описанию рецепта.
+
+        В PostgreSQL результаты сортируются по релевантности, в остальных
+        БД используется поиск по подстроке.
+        '''
+        if connections[self.db].vendor != 'postgresql':
+            return self.filter(
+                Q(name__icontains=query) | Q(text__icontains=query)
+            )
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.filter(
+            Q(search_vector=search_query) | Q(name__icontains=query)
+        ).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-pub_date')
+
+    def latest_per_author(self, limit):
+        '''Не более limit последних рецептов каждого автора.'''
+        return self.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).values('pk')[:limit]
+        ))
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     tags = models.ManyToManyField(
         Tag,
         related_name='recipes',
@@ -66,7 +165,13 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         'Картинка',
-        upload_to='recipes/images/'
+        upload_to='recipes/images/',
+        storage=ContentAddressedStorage()
+    )
+    image_renditions = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        editable=False
     )
     text = models.TextField(
         'Описание'
@@ -79,11 +184,38 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации',
     )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_popular_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -139,6 +271,8 @@ class FavoriteRecipe(models.Model):
         verbose_name='Рецепт, который добавляют в избранное'
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
@@ -167,6 +301,8 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт, который добавляют в список покупок'
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
@@ -179,3 +315,156 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в список покупок'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def totals(self, users=None, ingredients=None):
+        '''Суммы ингредиентов из корзин, посчитанные по исходным таблицам.'''
+        # Условия на корзину задаются одним filter(), иначе каждое
+        # добавит отдельный JOIN и суммы умножатся.
+        carts = {'recipe__shoppingcart__isnull': False}
+        if users is not None:
+            carts['recipe__shoppingcart__user__in'] = users
+        totals = RecipeIngredient.objects.filter(**carts)
+        if ingredients is not None:
+            totals = totals.filter(ingredient__in=ingredients)
+        return totals.values(
+            'recipe__shoppingcart__user', 'ingredient'
+        ).annotate(total_amount=Sum('amount')).order_by()
+
+    def refresh(self, users=None, ingredients=None):
+        '''Пересчитывает списки покупок пользователей.
+
+        Пересчитываются только позиции переданных пользователей
+        и ингредиентов, остальные строки таблицы не меняются.
+        '''
+        stale = self.all()
+        if users is not None:
+            stale = stale.filter(user__in=users)
+        if ingredients is not None:
+            stale = stale.filter(ingredient__in=ingredients)
+        with transaction.atomic():
+            if users is not None:
+                # Блокировка пользователей не дает параллельным пересчетам
+                # одного списка вставить одинаковые строки.
+                list(User.objects.select_for_update().filter(
+                    pk__in=users).values_list('pk', flat=True))
+            stale.delete()
+            self.bulk_create(
+                ShoppingListItem(
+                    user_id=row['recipe__shoppingcart__user'],
+                    ingredient_id=row['ingredient'],
+                    total_amount=row['total_amount'],
+                )
+                for row in self.totals(users, ingredients)
+            )
+
+
+class ShoppingListItem(models.Model):
+    '''Суммарное количество ингредиента в списке покупок пользователя.'''
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shoppinglistitem',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shoppinglistitem',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shoppinglistitem_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} в списке покупок {self.user}'
+
+
+class StoredImageQuerySet(models.QuerySet):
+
+    def acquire(self, name, count=1):
+        '''Увеличивает число ссылок на файл картинки.'''
+        self.get_or_create(name=name)
+        self.filter(name=name).update(
+            ref_count=F('ref_count') + count, updated=timezone.now()
+        )
+
+    def touch(self, name):
+        '''Обновляет время изменения файла, не меняя число ссылок.'''
+        return self.filter(name=name).update(updated=timezone.now())
+
+    def release(self, name):
+        '''Уменьшает число ссылок на файл картинки.'''
+        self.filter(name=name).update(
+            ref_count=F('ref_count') - 1, updated=timezone.now()
+        )
+
+
+class StoredImage(models.Model):
+    '''Файл картинки рецепта и число рецептов, которые на него ссылаются.
+
+    Файлы без ссылок удаляются командой collect_images.
+    '''
+
+    name = models.CharField(
+        'Файл',
+        max_length=100,
+        unique=True
+    )
+    ref_count = models.IntegerField(
+        'Число ссылок',
+        default=0
+    )
+    updated = models.DateTimeField(
+        'Изменен',
+        default=timezone.now
+    )
+
+    objects = StoredImageQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class ResourceVersion(models.Model):
+    '''Версия ресурса для условных GET-запросов (ETag и Last-Modified).
+
+    Версии хранятся в БД, поэтому изменение из любого процесса (другого
+    воркера, админки или команды manage.py) сразу меняет ETag.
+    '''
+
+    resource = models.CharField(
+        'Ресурс',
+        max_length=100,
+        unique=True
+    )
+    version = models.BigIntegerField(
+        'Версия'
+    )
+
+    class Meta:
+        verbose_name = 'Версия ресурса'
+        verbose_name_plural = 'Версии ресурсов'
+
+    def __str__(self):
+        return f'{self.resource}: {self.version}'
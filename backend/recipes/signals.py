@@ -0,0 +1,195 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_save
+)
+from django.dispatch import Signal, receiver
+
+from recipes.autocomplete import ingredient_index
+from recipes.counters import change_counters, change_link_counters
+from recipes.images import schedule_renditions
+from recipes.models import (
+    FavoriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, StoredImage, Tag
+)
+from recipes.versions import bump_version, forget_versions
+from users.models import Follow, User
+from users.signals import links_changed
+
+# Отправляется после изменения состава ингредиентов рецептов
+# (аргумент recipes — первичные ключи рецептов). Сохранение отдельных
+# RecipeIngredient сигналов не вызывает: при правке рецепта строки
+# меняются пакетно, и пересчет выполняется один раз на рецепт.
+recipe_ingredients_changed = Signal()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.refresh(
+            users=[instance.user_id],
+            ingredients=RecipeIngredient.objects.filter(
+                recipe=instance.recipe_id
+            ).values('ingredient')
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    # При каскадном удалении рецепта его ингредиенты могут быть уже
+    # удалены, поэтому список покупок пересчитывается целиком.
+    ShoppingListItem.objects.refresh(users=[instance.user_id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    bump_version('ingredients')
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_state(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and not {'image', 'author'} & set(
+        update_fields
+    ):
+        return
+    instance._old_image, instance._old_author_id = (
+        Recipe.objects.filter(pk=instance.pk).values_list(
+            'image', 'author').first()
+        if instance.pk else None
+    ) or (None, None)
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_image_references(sender, instance, **kwargs):
+    if not hasattr(instance, '_old_image'):
+        return
+    old_image = instance.__dict__.pop('_old_image')
+    if old_image == instance.image.name:
+        return
+    if instance.image:
+        StoredImage.objects.acquire(instance.image.name)
+    if old_image:
+        StoredImage.objects.release(old_image)
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_author_change(sender, instance, created, **kwargs):
+    old_author_id = instance.__dict__.pop('_old_author_id', None)
+    if created or old_author_id in (None, instance.author_id):
+        return
+    change_counters(sender, Recipe(author_id=old_author_id), -1)
+    change_counters(sender, instance, 1)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def increment_counters(sender, instance, created, **kwargs):
+    if created:
+        change_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=Recipe)
+def decrement_counters(sender, instance, **kwargs):
+    change_counters(sender, instance, -1)
+
+
+@receiver(links_changed)
+def change_changed_link_counters(sender, targets, created, **kwargs):
+    change_link_counters(sender, targets, 1 if created else -1)
+
+
+@receiver(links_changed, sender=ShoppingCart)
+def refresh_changed_shopping_list(sender, user, **kwargs):
+    ShoppingListItem.objects.refresh(users=[user.pk])
+
+
+@receiver(links_changed)
+def bump_changed_links_user_version(sender, user, **kwargs):
+    bump_version(f'user:{user.pk}')
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    if instance.image:
+        StoredImage.objects.release(instance.image.name)
+
+
+@receiver(post_save, sender=Recipe)
+def make_recipe_image_renditions(sender, instance, **kwargs):
+    if (
+        instance.image
+        and instance.image_renditions.get('source') != instance.image.name
+    ):
+        transaction.on_commit(lambda: schedule_renditions(instance))
+
+
+@receiver(post_save, sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    bump_version(f'recipe:{instance.pk}')
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_recipe_version(sender, instance, **kwargs):
+    forget_versions(f'recipe:{instance.pk}')
+
+
+@receiver(post_delete, sender=User)
+def forget_user_version(sender, instance, **kwargs):
+    forget_versions(f'user:{instance.pk}')
+
+
+@receiver(recipe_ingredients_changed)
+def refresh_recipe_ingredients(sender, recipes, **kwargs):
+    ShoppingListItem.objects.refresh(
+        users=ShoppingCart.objects.filter(recipe__in=recipes).values('user')
+    )
+    bump_version(*(f'recipe:{pk}' for pk in recipes))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_version(f'recipe:{instance.pk}')
+    elif pk_set:
+        bump_version(*(f'recipe:{pk}' for pk in pk_set))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_user_version(sender, instance, **kwargs):
+    bump_version(f'user:{instance.user_id}')
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(sender, instance, created, update_fields,
+                                **kwargs):
+    if created or update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_version(*(
+        f'recipe:{pk}'
+        for pk in instance.recipes.values_list('pk', flat=True)
+    ))
@@ -0,0 +1,49 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''Хранилище, в котором имя файла — хэш его содержимого.
+
+    Файл сохраняется как <каталог>/<ab>/<sha256>.<расширение>, где ab —
+    первые символы хэша. Повторная загрузка той же картинки не создает
+    новый файл, а возвращает имя уже сохраненного и обновляет время его
+    изменения.
+    '''
+
+    hash_chunk_size = 64 * 1024
+
+    def digest(self, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks(self.hash_chunk_size):
+            sha256.update(chunk)
+        if hasattr(content, 'seek') and callable(content.seek):
+            content.seek(0)
+        return sha256.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = self.digest(content)
+        dirname = os.path.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        name = os.path.join(dirname, digest[:2], digest + ext).replace(
+            '\\', '/'
+        )
+        # Повторная загрузка продлевает жизнь файла до того, как на него
+        # сошлется рецепт, иначе collect_images мог бы удалить его в этот
+        # момент. Если collect_images уже удаляет файл, обновление
+        # дождется конца его транзакции, и файл будет записан заново.
+        from recipes.models import StoredImage
+        StoredImage.objects.touch(name)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return self._save(name, content)
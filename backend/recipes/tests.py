@@ -0,0 +1,53 @@
+from django.test import TestCase
+
+from recipes.counters import reconcile
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from users.models import Follow, User
+
+
+class StaleSaveCountersTest(TestCase):
+    '''save() устаревшего объекта не затирает счетчики.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            cooking_time=10, image='recipes/images/recipe.jpg'
+        )
+
+    def test_user_counters_survive_stale_save(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Recipe.objects.create(
+            author=self.author, name='Еще рецепт', text='Текст',
+            cooking_time=5, image='recipes/images/recipe.jpg'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        stale.set_password('new-password')
+        stale.first_name = 'Автор'
+        stale.save()
+
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(author.recipes_count, 2)
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.first_name, 'Автор')
+        self.assertTrue(author.check_password('new-password'))
+        self.assertFalse(any(reconcile(dry_run=True).values()))
+
+    def test_recipe_counters_survive_stale_save(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        FavoriteRecipe.objects.create(user=self.reader, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipe)
+        stale.name = 'Новое название'
+        stale.save()
+
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 1)
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertFalse(any(reconcile(dry_run=True).values()))
@@ -0,0 +1,46 @@
+import time
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from recipes.models import ResourceVersion
+
+
+# Версия ресурса, который еще ни разу не менялся. Строки версий
+# создаются только при изменениях, чтение их не создает.
+INITIAL_VERSION = 0
+
+
+def get_versions(resources):
+    '''Версии ресурсов (время последнего изменения в секундах).'''
+    versions = dict(ResourceVersion.objects.filter(
+        resource__in=resources).values_list('resource', 'version'))
+    return [versions.get(resource, INITIAL_VERSION) for resource in resources]
+
+
+def bump_version(*resources):
+    '''Отмечает ресурсы измененными.
+
+    Новая версия всегда больше предыдущей, даже если изменения
+    произошли в пределах одной секунды. Внутри транзакции новая версия
+    становится видна другим процессам только вместе с самими изменениями.
+    '''
+    # Порядок строк постоянный, чтобы параллельные транзакции
+    # не блокировали друг друга крест-накрест.
+    resources = sorted(set(resources))
+    now = int(time.time())
+    ResourceVersion.objects.bulk_create(
+        (
+            ResourceVersion(resource=resource, version=now)
+            for resource in resources
+        ),
+        ignore_conflicts=True
+    )
+    ResourceVersion.objects.filter(resource__in=resources).update(
+        version=Greatest(Value(now), F('version') + 1)
+    )
+
+
+def forget_versions(*resources):
+    '''Удаляет версии ресурсов, которых больше нет.'''
+    ResourceVersion.objects.filter(resource__in=resources).delete()
@@ -6,7 +6,8 @@ from users.models import User, Follow
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = (
-        'id', 'username', 'password', 'email', 'first_name', 'last_name'
+        'id', 'username', 'password', 'email', 'first_name', 'last_name',
+        'recipes_count', 'followers_count'
     )
     search_fields = ('username',)
     list_filter = ('username', 'email')
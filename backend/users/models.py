@@ -1,11 +1,214 @@
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Exists, OuterRef, Value
+from django.db.models.signals import post_delete, post_save
 
+from users.signals import links_changed
 
-class User(AbstractUser):
+
+class UserQuerySet(models.QuerySet):
+
+    def with_is_subscribed(self, user):
+        '''Флаг подписки текущего пользователя одним запросом.'''
+        if user.is_anonymous:
+            return self.annotate(is_subscribed=Value(False))
+        return self.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+
+
+class LinkQuerySet(models.QuerySet):
+    '''Связи пользователя с объектом: подписки, избранное, корзина.
+
+    add() и remove() в PostgreSQL меняют связь одним запросом
+    INSERT ... ON CONFLICT DO NOTHING / DELETE ... RETURNING, результат
+    определяется по затронутым строкам, поэтому повторные и параллельные
+    запросы не приводят к IntegrityError. Сигналы post_save и post_delete
+    отправляются так же, как при save() и delete(), и их обработчики
+    добавляют свои запросы: счетчики, версии, список покупок.
+    '''
+
+    @property
+    def target_field(self):
+        return next(
+            field for field in self.model._meta.concrete_fields
+            if field.is_relation and field.name != 'user'
+        )
+
+    def add(self, user, target_id):
+        '''Создает связь; None, если она уже есть или объекта нет.'''
+        field = self.target_field
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            return self._add_with_orm(user, target_id)
+        quote = connection.ops.quote_name
+        target_table = quote(field.related_model._meta.db_table)
+        target_pk = quote(field.target_field.column)
+        with connection.cursor() as cursor:
+            # Строка вставляется, только если объект существует.
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'(user_id, {quote(field.column)}) '
+                f'SELECT %s, {target_pk} FROM {target_table} '
+                f'WHERE {target_pk} = %s '
+                'ON CONFLICT DO NOTHING RETURNING id',
+                (user.pk, target_id)
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        instance = self.model(
+            pk=row[0], user=user, **{field.attname: target_id}
+        )
+        post_save.send(
+            sender=self.model, instance=instance, created=True,
+            update_fields=None, raw=False, using=self.db
+        )
+        return instance
+
+    def _add_with_orm(self, user, target_id):
+        field = self.target_field
+        if not field.related_model.objects.filter(pk=target_id).exists():
+            return None
+        try:
+            with transaction.atomic(using=self.db):
+                return self.create(user=user, **{field.attname: target_id})
+        except IntegrityError:
+            return None
+
+    def remove(self, user, target_id):
+        '''Удаляет связь; False, если ее не было.'''
+        field = self.target_field
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            links = list(self.filter(user=user, **{field.attname: target_id}))
+            for link in links:
+                link.delete()
+            return bool(links)
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(self.model._meta.db_table)} '
+                f'WHERE user_id = %s AND {quote(field.column)} = %s '
+                'RETURNING id',
+                (user.pk, target_id)
+            )
+            rows = cursor.fetchall()
+        for pk, in rows:
+            post_delete.send(
+                sender=self.model,
+                instance=self.model(
+                    pk=pk, user=user, **{field.attname: target_id}
+                ),
+                using=self.db
+            )
+        return bool(rows)
+
+    def add_many(self, user, target_ids):
+        '''Создает связи с объектами; возвращает id добавленных.
+
+        Несуществующие объекты и уже существующие связи пропускаются.
+        '''
+        field = self.target_field
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            added = set(field.related_model.objects.filter(
+                pk__in=target_ids).values_list('pk', flat=True)) - set(
+                self.filter(
+                    user=user, **{f'{field.attname}__in': target_ids}
+                ).values_list(field.attname, flat=True))
+            self.bulk_create(
+                (
+                    self.model(user=user, **{field.attname: target_id})
+                    for target_id in added
+                ),
+                ignore_conflicts=True
+            )
+        else:
+            quote = connection.ops.quote_name
+            target_table = quote(field.related_model._meta.db_table)
+            target_pk = quote(field.target_field.column)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {quote(self.model._meta.db_table)} '
+                    f'(user_id, {quote(field.column)}) '
+                    f'SELECT %s, {target_pk} FROM {target_table} '
+                    f'WHERE {target_pk} = ANY(%s) '
+                    f'ON CONFLICT DO NOTHING RETURNING {quote(field.column)}',
+                    (user.pk, list(target_ids))
+                )
+                added = {target_id for target_id, in cursor.fetchall()}
+        if added:
+            links_changed.send(
+                sender=self.model, user=user, targets=added, created=True
+            )
+        return added
+
+    def remove_many(self, user, target_ids):
+        '''Удаляет связи с объектами; возвращает id удаленных.'''
+        field = self.target_field
+        connection = connections[self.db]
+        links = self.filter(user=user, **{f'{field.attname}__in': target_ids})
+        if connection.vendor != 'postgresql':
+            # delete() сам отправляет post_delete для каждой строки.
+            removed = set(links.values_list(field.attname, flat=True))
+            links.delete()
+            return removed
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(self.model._meta.db_table)} '
+                f'WHERE user_id = %s AND {quote(field.column)} = ANY(%s) '
+                f'RETURNING {quote(field.column)}',
+                (user.pk, list(target_ids))
+            )
+            removed = {target_id for target_id, in cursor.fetchall()}
+        if removed:
+            links_changed.send(
+                sender=self.model, user=user, targets=removed, created=False
+            )
+        return removed
+
+
+class CounterFieldsMixin:
+    '''Модель со счетчиками, которые меняются только через F().
+
+    Обычный save() существующей строки не записывает поля counter_fields:
+    значения в памяти могут быть устаревшими и затерли бы изменения,
+    сделанные параллельными запросами (см. recipes.counters).
+    '''
+
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (
+            update_fields is None
+            and not force_insert
+            and not self._state.adding
+        ):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.counter_fields
+            ]
+        super().save(
+            force_insert=force_insert, force_update=force_update,
+            using=using, update_fields=update_fields
+        )
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
+class User(CounterFieldsMixin, AbstractUser):
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'password']
+    counter_fields = ('recipes_count', 'followers_count')
 
     email = models.EmailField(
         verbose_name='Адрес электронной почты',
@@ -23,6 +226,18 @@ class User(AbstractUser):
         'Пароль',
         max_length=150
     )
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        editable=False
+    )
+
+    objects = CustomUserManager()
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -44,6 +259,8 @@ class Follow(models.Model):
         verbose_name='Тот, на кого подписываются'
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Отправляется после пакетного добавления или удаления связей
+# пользователя (LinkQuerySet.add_many / remove_many), вместо post_save
+# и post_delete для каждой строки. Аргументы: user, targets —
+# первичные ключи объектов, created — связи добавлены или удалены.
+links_changed = Signal()